@@ -1,28 +1,41 @@
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
-from openai import OpenAI
-import boto3
-from botocore.exceptions import NoCredentialsError
-from dotenv import load_dotenv
+from threading import Condition, Lock, Thread
+import queue
+import time
 import os
 import logging
 import json
+from environment import configure_logging, load_environment
 
-# Load environment variables
-load_dotenv(dotenv_path='../.env', override=True)
-client = OpenAI()
+# Run standalone, ../.env is loaded before the TRANSFER_*, INGEST_* and concurrency settings are read
+if __name__ == "__main__":
+    load_environment()
 
-file_contents = [] # List of file contents retrieved from Digital Ocean Spaces
-upload_file_ids = [] # List of file ids to be uploaded to Vector Store
-lock = Lock()
+from dataset_formats import decode_body
+from spaces_upload import call_spaces, iter_object_pages, spaces_bucket, submit_upload, wait_for_uploads
+from vector_store_ingestion import ingest_files, log_report
+from concurrency_control import OPENAI_MAX_CONCURRENCY, SPACES_MAX_CONCURRENCY, call_openai, iter_openai_items, log_limiter_stats
 
-# Set up logging configuration
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    handlers=[logging.FileHandler('assistant_resource_allocate.log', 'w', 'utf-8')])
+# Log file of a standalone run
+LOG_FILE = 'assistant_resource_allocate.log'
 
 logger = logging.getLogger(__name__)
 
+_client = None
+_client_lock = Lock()
+
+# Function to get the process-wide OpenAI client, created on first use so that importing this module
+# neither imports the OpenAI SDK nor requires OPENAI_API_KEY. The SDK's own retries are off: calls run through
+# call_openai, whose limiter retries throttled calls and lowers the limit, and which retries transient errors.
+def get_openai_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+            load_environment()
+            _client = OpenAI(max_retries=0)
+        return _client
+
 def load_config(config_file="config.json"):
     if os.path.exists(config_file):
         with open(config_file, "r") as f:
@@ -35,71 +48,141 @@ def save_config(config, config_file="config.json"):
     with open(config_file, "w") as f:
         json.dump(config, f)
 
-# Get Digital Ocean credentials from environment variables
-DO_SPACES_KEY = os.getenv('DO_SPACES_KEY')
-DO_SPACES_SECRET = os.getenv('DO_SPACES_SECRET')
-DO_SPACES_REGION = os.getenv('DO_SPACES_REGION', 'nyc3')
-DO_SPACES_BUCKET = os.getenv('DO_SPACES_BUCKET')
-
-# Configure the boto3 client
-session = boto3.session.Session()
-s3_client = session.client('s3',
-                        region_name=DO_SPACES_REGION,
-                        endpoint_url='https://nyc3.digitaloceanspaces.com',
-                        aws_access_key_id=DO_SPACES_KEY,
-                        aws_secret_access_key=DO_SPACES_SECRET)
-
 prefix = 'course_data/'
 id_prefix = 'ids/'
-
-# Function to upload id file content to Digital Ocean Spaces
+state_prefix = 'state/'
+
+# Manifest of the files in the Vector Store, and how it is refreshed: "sync" only replaces the files whose
+# Spaces objects changed, "full" deletes every file and uploads the whole corpus again
+MANIFEST_OBJECT_NAME = 'vector_store_manifest.json'
+VECTOR_STORE_REFRESH_MODE = os.getenv('VECTOR_STORE_REFRESH_MODE', 'sync')
+
+# Workers and limits of the transfer from Spaces to file storage; downloads wait while the bytes downloaded
+# but not yet uploaded exceed TRANSFER_MAX_INFLIGHT_BYTES. Worker pools are sized to the maximum of the shared
+# limiters, which decide how many calls actually run at once.
+TRANSFER_DOWNLOAD_WORKERS = int(os.getenv('TRANSFER_DOWNLOAD_WORKERS', SPACES_MAX_CONCURRENCY))
+TRANSFER_UPLOAD_WORKERS = int(os.getenv('TRANSFER_UPLOAD_WORKERS', OPENAI_MAX_CONCURRENCY))
+TRANSFER_QUEUE_SIZE = int(os.getenv('TRANSFER_QUEUE_SIZE', 16))
+TRANSFER_MAX_INFLIGHT_BYTES = int(os.getenv('TRANSFER_MAX_INFLIGHT_BYTES', 64 * 1024 * 1024))
+
+# Extensions of the objects uploaded to the Vector Store
+VECTOR_STORE_EXTENSIONS = ('.json', '.html', '.txt', '.md', '.pdf')
+
+# Function to queue id file content for upload to Digital Ocean Spaces. The frontend reads the ids file
+# without decoding, so it is never gzip-encoded.
 def upload_file_to_spaces(content, object_name):
-    try:
-        response = s3_client.put_object(
-            Bucket=DO_SPACES_BUCKET,
-            Key=id_prefix + object_name,
-            Body=content,
-            ContentType='application/json'
-        )
-        logger.info(response)
-        logger.info(f"Successfully uploaded {object_name} to {DO_SPACES_BUCKET}/{id_prefix}")
-    except NoCredentialsError:
-        logger.info("Credentials not available", exc_info=True)
-    except Exception as e:
-        logger.error(f"Failed to upload {object_name} to {DO_SPACES_BUCKET}/{id_prefix}", exc_info=True)
-
-def retrieve_file_from_spaces(file):
-    file_key = file['Key']
-    file_obj = s3_client.get_object(Bucket=DO_SPACES_BUCKET, Key=file_key)
-    file_content = file_obj['Body'].read()
-    with lock:
-        file_contents.append((file_key, file_content))
-    logger.info(f"File {file} retrieved successfully")
+    submit_upload(spaces_bucket(), id_prefix + object_name, content, 'application/json', compress=False)
+
+# Function to download an object from Digital Ocean Spaces as (key, body, content encoding), leaving the body
+# encoded as stored so that it takes no more memory than its listed size until it is uploaded
+def download_file_from_spaces(file_key):
+    file_obj = call_spaces('get_object', Bucket=spaces_bucket(), Key=file_key)
+    return file_key, file_obj['Body'].read(), file_obj.get('ContentEncoding')
+
+# Generator yielding the listing entries (Key, ETag, Size) of the objects to index, one page of 1000 at a time
+def iter_spaces_objects():
+    for page in iter_object_pages(spaces_bucket(), prefix):
+        for obj in page.get('Contents', []):
+            # Columnar and JSON Lines copies of the datasets cannot be indexed by file search
+            if obj['Key'].endswith(VECTOR_STORE_EXTENSIONS):
+                yield obj
+
+class ByteBudget:
+    """
+    Counter of the bytes held in memory by a transfer. `acquire` blocks while adding `size` would exceed
+    `max_bytes`, except when nothing is held, so an object larger than the budget still goes through alone.
+    """
 
-def retrieve_files_from_spaces():
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self.peak = 0
+        self._condition = Condition()
+
+    def acquire(self, size):
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight == 0 or self.in_flight + size <= self.max_bytes)
+            self.in_flight += size
+            self.peak = max(self.peak, self.in_flight)
+
+    def release(self, size):
+        with self._condition:
+            self.in_flight -= size
+            self._condition.notify_all()
+
+def transfer_files_to_vector_store(vector_store_id, objects, published=None, download_workers=TRANSFER_DOWNLOAD_WORKERS,
+                                   upload_workers=TRANSFER_UPLOAD_WORKERS, max_inflight_bytes=TRANSFER_MAX_INFLIGHT_BYTES):
     """
-    Retrieve files from Digital Ocean Spaces.
+    Stream Spaces objects into file storage, returning a report keyed by Spaces key with each object's
+    "file_id", "status" ("uploaded" or "upload_failed") and "upload_seconds".
+
+    `objects` is an iterable of listing entries and is consumed lazily. Each object is uploaded as soon as
+    its download lands, through a bounded queue; no more than `max_inflight_bytes` of downloaded content
+    is held at once, counted by the listed object sizes. Bodies stay encoded as stored (gzip for HTML and
+    JSON) while they wait, and each upload worker decodes only the body it is uploading. Objects found in `published` (key -> (ETag,
+    stored body, Content-Encoding), as kept by the Spaces uploader during this run) with the listed ETag are not downloaded.
     """
+    budget = ByteBudget(max_inflight_bytes)
+    downloaded = queue.Queue(maxsize=TRANSFER_QUEUE_SIZE)
+    published = published or {}
+    report = {}
+    reused = []
+
+    def download(obj):
+        start_time = time.monotonic()
+        try:
+            etag, content, encoding = published.get(obj['Key'], (None, None, None))
+            if etag == obj['ETag'].strip('"'):
+                # Already held by the uploader, so handing it over takes no more memory
+                file_key, file_content, content_encoding = obj['Key'], content, encoding
+                reused.append(file_key)
+            else:
+                file_key, file_content, content_encoding = download_file_from_spaces(obj['Key'])
+        except Exception as e:
+            logger.error(f"Failed to download {obj['Key']}: {e}")
+            budget.release(obj['Size'])
+            report[obj['Key']] = {'file_id': None, 'status': 'upload_failed', 'upload_seconds': None, 'error': str(e)}
+            return
+        downloaded.put((obj, file_key, file_content, content_encoding, start_time))
+
+    def upload():
+        while True:
+            item = downloaded.get()
+            if item is None:
+                break
+            obj, file_key, file_content, content_encoding, start_time = item
+            try:
+                file_id = create_vector_store_file(vector_store_id, (file_key, decode_body(file_content, content_encoding)))
+            except Exception as e:
+                logger.error(f"Failed to decode {file_key}: {e}")
+                file_id = None
+            finally:
+                budget.release(obj['Size'])
+            report[file_key] = {'file_id': file_id, 'status': 'uploaded' if file_id else 'upload_failed',
+                                'upload_seconds': time.monotonic() - start_time}
+
+    uploaders = [Thread(target=upload, daemon=True) for _ in range(upload_workers)]
+    for uploader in uploaders:
+        uploader.start()
     try:
-        logger.info("Retrieving files from Digital Ocean Spaces")
-        response = s3_client.list_objects(Bucket=DO_SPACES_BUCKET)
-        files = response.get('Contents', [])
-        logger.info(f"Files retrieved: {files}")
- 
-        with ThreadPoolExecutor() as executor:
-            futures = [executor.submit(retrieve_file_from_spaces, file) for file in files]
-            for future in as_completed(futures):
-                future.result()
-            
-        return file_contents
-
-    except NoCredentialsError:
-        logger.error("Credentials not available")
-        return []
+        with ThreadPoolExecutor(max_workers=download_workers) as executor:
+            for obj in objects:
+                budget.acquire(obj['Size'])
+                executor.submit(download, obj)
+    finally:
+        for _ in uploaders:
+            downloaded.put(None)
+        for uploader in uploaders:
+            uploader.join()
+    uploaded = sum(1 for entry in report.values() if entry['file_id'])
+    logger.info(f"Transferred {uploaded} files to file storage ({len(report) - uploaded} failed, "
+                f"{len(reused)} taken from memory instead of Spaces), peak {budget.peak} bytes in flight")
+    return report
 
 def delete_file_from_vector_store(vector_store_id, file_id):
     try:
-        client.beta.vector_stores.files.delete(
+        call_openai(
+            get_openai_client().beta.vector_stores.files.delete,
             vector_store_id = vector_store_id,
             file_id = file_id
         )
@@ -109,57 +192,127 @@ def delete_file_from_vector_store(vector_store_id, file_id):
 
 def create_vector_store_file(vector_store_id, file_content):
     try:
-        file = client.files.create(file=file_content, purpose="assistants")
-        with lock:
-            upload_file_ids.append(file.id)
+        file = call_openai(get_openai_client().files.create, file=file_content, purpose="assistants")
         logger.info(f"Created file in Vector Store: {file.id}")
+        return file.id
     except Exception as e:
         logger.error(f"An error occurred: {e}")
+        return None
 
 
-def refresh_vector_store(vector_store_id):
+def refresh_vector_store(vector_store_id, published=None):
     """
     Refresh the vector store with the latest course data.
     """
     logger.info("Refreshing Vector Store")
     try:
         # Delete Files from Vector Store
-        files_to_delete = client.beta.vector_stores.files.list(
-            vector_store_id = vector_store_id
-        )
+        files_to_delete = iter_openai_items(get_openai_client().beta.vector_stores.files.list,
+                                            vector_store_id=vector_store_id)
         delete_file_ids = [file.id for file in files_to_delete]
 
-        with ThreadPoolExecutor(max_workers=5) as executor:
+        with ThreadPoolExecutor(max_workers=OPENAI_MAX_CONCURRENCY) as executor:
             futures = [executor.submit(delete_file_from_vector_store, vector_store_id, file_id) for file_id in delete_file_ids]
             for future in as_completed(futures):
                 future.result()
         logger.info("Deleted files from Vector Store")
 
-        # Retrieve Files from Digital Ocean Spaces
-        files = retrieve_files_from_spaces()
+        # Stream Files from Digital Ocean Spaces to file storage while the listing is paged through
+        report = transfer_files_to_vector_store(vector_store_id, iter_spaces_objects(), published)
+        logger.info("Uploaded files to Vector Store")
 
-        # Upload Files to Vector Store as File Batch
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = [executor.submit(create_vector_store_file, vector_store_id, file_content) for file_content in files]
+        # Attach the Files to the Vector Store in File Batches and wait until they are indexed
+        ingest_files(get_openai_client(), vector_store_id, report)
+        log_report(report)
+        return report
+
+    except Exception as e:
+        logger.error(f"An error occurred: {e}")
+        raise # The Assistant is not pointed at a Vector Store that was left half refreshed
+
+# Function to load the manifest of the files in a Vector Store: Spaces key -> {"etag", "file_id"}.
+# A manifest written for another Vector Store is ignored.
+def load_vector_store_manifest(vector_store_id):
+    from botocore.exceptions import ClientError
+    try:
+        response = call_spaces('get_object', Bucket=spaces_bucket(), Key=state_prefix + MANIFEST_OBJECT_NAME)
+        manifest = json.loads(decode_body(response['Body'].read(), response.get('ContentEncoding')))
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return {}
+        raise
+    if manifest.get('vector_store_id') != vector_store_id:
+        logger.info(f"Manifest belongs to Vector Store {manifest.get('vector_store_id')}, starting a new one")
+        return {}
+    return manifest.get('files', {})
+
+def save_vector_store_manifest(vector_store_id, files):
+    manifest = {'vector_store_id': vector_store_id, 'files': files}
+    submit_upload(spaces_bucket(), state_prefix + MANIFEST_OBJECT_NAME, json.dumps(manifest), 'application/json')
+
+# Function to delete a file from the Vector Store and from file storage
+def delete_vector_store_file(vector_store_id, file_id):
+    delete_file_from_vector_store(vector_store_id, file_id)
+    try:
+        call_openai(get_openai_client().files.delete, file_id)
+    except Exception as e:
+        logger.error(f"Failed to delete file {file_id}: {e}")
+
+def sync_vector_store(vector_store_id, published=None):
+    """
+    Bring the vector store in line with Digital Ocean Spaces, touching only what changed.
+
+    Objects are compared by the ETag of their listing against the manifest, so unchanged objects are
+    neither downloaded nor re-embedded. New and changed objects are uploaded and ingested in tracked file
+    batches; files of changed or removed objects, and files the manifest does not know about, are deleted.
+    Returns the ingestion report of the uploaded objects.
+    """
+    logger.info("Syncing Vector Store")
+    try:
+        objects = {obj['Key']: obj for obj in iter_spaces_objects()}
+        manifest = load_vector_store_manifest(vector_store_id)
+        attached_ids = {file.id for file in iter_openai_items(get_openai_client().beta.vector_stores.files.list,
+                                                              vector_store_id=vector_store_id)}
+
+        # Entries whose file was detached outside this sync are uploaded again
+        current = {key: entry for key, entry in manifest.items()
+                   if key in objects and objects[key]['ETag'].strip('"') == entry['etag'] and entry['file_id'] in attached_ids}
+        to_upload = [key for key in objects if key not in current]
+        kept_ids = {entry['file_id'] for entry in current.values()}
+        to_delete = (attached_ids | {entry['file_id'] for entry in manifest.values()}) - kept_ids
+        logger.info(f"Vector Store sync: {len(current)} unchanged, {len(to_upload)} to upload, {len(to_delete)} to delete")
+
+        with ThreadPoolExecutor(max_workers=OPENAI_MAX_CONCURRENCY) as executor:
+            futures = [executor.submit(delete_vector_store_file, vector_store_id, file_id) for file_id in to_delete]
             for future in as_completed(futures):
                 future.result()
-        logger.info("Uploaded files to Vector Store")
-        
-        client.beta.vector_stores.file_batches.create(
-            vector_store_id = vector_store_id,
-            file_ids = upload_file_ids
-        )
-        logger.info(f"Uploaded files to Vector Store, {upload_file_ids}")
+
+        report = transfer_files_to_vector_store(vector_store_id, (objects[key] for key in to_upload), published)
+        ingest_files(get_openai_client(), vector_store_id, report)
+        log_report(report)
+
+        # Files that did not finish indexing are removed and stay out of the manifest, so the next sync retries them
+        indexed = 0
+        for key, entry in report.items():
+            if entry['status'] == 'completed':
+                current[key] = {'etag': objects[key]['ETag'].strip('"'), 'file_id': entry['file_id']}
+                indexed += 1
+            elif entry['file_id']:
+                delete_vector_store_file(vector_store_id, entry['file_id'])
+        logger.info(f"Synced Vector Store: {indexed} of {len(to_upload)} indexed, {len(to_delete)} deleted")
+        save_vector_store_manifest(vector_store_id, current)
+        return report
 
     except Exception as e:
         logger.error(f"An error occurred: {e}")
+        raise # The Assistant is not pointed at a Vector Store that was left half refreshed
 
 def check_vector_store_exists(vector_store_id):
     if not vector_store_id:
         return False
     try:
         logger.info(f"Checking Vector Store: {vector_store_id}")
-        response = client.beta.vector_stores.retrieve(vector_store_id)
+        response = call_openai(get_openai_client().beta.vector_stores.retrieve, vector_store_id)
         exists = True if response else False
         return exists
     except Exception as e:
@@ -171,19 +324,20 @@ def check_assistant_exists(assistant_id):
         return False
     try:
         logger.info(f"Checking Assistant: {assistant_id}")
-        response = client.beta.assistants.retrieve(assistant_id)
+        response = call_openai(get_openai_client().beta.assistants.retrieve, assistant_id)
         exists = True if response else False
         return exists
     except Exception as e:
         logger.error(f"An error occurred: {e}")
         return False
 
-def create_resources_if_needed(config):
+def create_resources_if_needed(config, published=None):
     assistant_id = config.get("assistant_id")
     vector_store_id = config.get("vector_store_id")
 
     if not check_assistant_exists(assistant_id):
-        course_mentor_assistant = client.beta.assistants.create(
+        course_mentor_assistant = call_openai(
+            get_openai_client().beta.assistants.create,
             model="gpt-4o-mini",
             name="NJIT Course Mentor",
             description="Assistant to help NJIT students plan their courses.",
@@ -256,12 +410,16 @@ def create_resources_if_needed(config):
         logger.info(f"Created Assistant: {assistant_id}")
 
     if not check_vector_store_exists(vector_store_id):
-        vector_store = client.beta.vector_stores.create(name="NJIT Course Data")
+        vector_store = call_openai(get_openai_client().beta.vector_stores.create, name="NJIT Course Data")
         vector_store_id = vector_store.id
         config["vector_store_id"] = vector_store_id
-    refresh_vector_store(vector_store_id)
+    if VECTOR_STORE_REFRESH_MODE == 'full':
+        refresh_vector_store(vector_store_id, published)
+    else:
+        sync_vector_store(vector_store_id, published)
     
-    course_mentor_assistant = client.beta.assistants.update(
+    course_mentor_assistant = call_openai(
+        get_openai_client().beta.assistants.update,
         assistant_id=assistant_id,
         tool_resources={"file_search":  {"vector_store_ids": [vector_store_id]}},
     )
@@ -273,9 +431,11 @@ def create_resources_if_needed(config):
 
     return assistant_id, vector_store_id
 
-def assistant_resource_allocate():
+# Main function to refresh the Assistant's resources. `published` holds the objects the earlier stages of this
+# run published, keyed by Spaces key, so they are not downloaded again.
+def assistant_resource_allocate(published=None):
     config = load_config()
-    assistant_id, vector_store_id = create_resources_if_needed(config)
+    assistant_id, vector_store_id = create_resources_if_needed(config, published)
 
     # Create json file for ids
     ids = {
@@ -284,6 +444,9 @@ def assistant_resource_allocate():
     }
 
     upload_file_to_spaces(json.dumps(ids), "ids.json")
+    wait_for_uploads()
+    log_limiter_stats()
 
 if __name__ == "__main__":
+    configure_logging(LOG_FILE)
     assistant_resource_allocate()
\ No newline at end of file
@@ -1,16 +1,112 @@
+import contextvars
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from environment import configure_logging, load_environment
+
+# A backend run loads ../.env before the stage modules read their settings at import
+if __name__ == "__main__":
+    load_environment()
+
 from fetch_and_parse_php_to_dataframe import fetch_and_parse_php
 from njit_catalog_scraper import njit_catalog_scraper
-from assistant_resource_allocate import assistant_resource_allocate
+from assistant_resource_allocate import VECTOR_STORE_EXTENSIONS, assistant_resource_allocate, prefix
+from spaces_upload import get_uploader, start_upload_group
 
-def run_all_backends():
-    # Fetch and upload NJIT PHP data to Digital Ocean Spaces
-    fetch_and_parse_php()
+# Log file of a backend run, shared by every stage
+LOG_FILE = 'backend_runner.log'
+
+logger = logging.getLogger(__name__)
 
+# Stage name -> (function taking the results of its dependencies, names of the stages it depends on)
+STAGES = {
+    # Fetch and upload NJIT PHP data to Digital Ocean Spaces
+    'fetch_and_parse_php': (lambda results: fetch_and_parse_php(), ()),
     # Scrape and upload NJIT Course Data to Digital Ocean Spaces
-    njit_catalog_scraper()
+    'njit_catalog_scraper': (lambda results: njit_catalog_scraper(), ()),
+    # Allocate resources to the Assistant from what the stages above published, without downloading it again
+    'assistant_resource_allocate': (lambda results: assistant_resource_allocate(published=get_uploader().published_objects()),
+                                    ('fetch_and_parse_php', 'njit_catalog_scraper')),
+}
+
+def run_stage(name, func, results):
+    # Each stage waits only for its own uploads to Spaces
+    start_upload_group()
+    return func(results)
+
+def run_stages(stages):
+    """
+    Run a DAG of stages, each as soon as the stages it depends on have finished, so independent stages run
+    concurrently. Returns the stage results, their (start, end) times and the names of the stages that failed
+    or were skipped because a stage they depend on failed.
+    """
+    results = {}
+    timings = {}
+    failed = set()
+    remaining = dict(stages)
+    running = {}
+    run_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+        while remaining or running:
+            for name, (func, dependencies) in list(remaining.items()):
+                if any(dependency in failed for dependency in dependencies):
+                    logger.error(f"Skipping {name}: a stage it depends on failed")
+                    failed.add(name)
+                    del remaining[name]
+                elif all(dependency in results for dependency in dependencies):
+                    inputs = {dependency: results[dependency] for dependency in dependencies}
+                    timings[name] = [time.perf_counter() - run_start, None]
+                    # A copy of the context per stage keeps its upload group separate from the other stages
+                    running[executor.submit(contextvars.copy_context().run, run_stage, name, func, inputs)] = name
+                    del remaining[name]
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                timings[name][1] = time.perf_counter() - run_start
+                try:
+                    results[name] = future.result()
+                except Exception:
+                    logger.error(f"Stage {name} failed", exc_info=True)
+                    failed.add(name)
+    return results, {name: tuple(timing) for name, timing in timings.items()}, failed
 
-    # Allocate resources to the Assistant
-    assistant_resource_allocate()
+# Function to find the chain of stages that determined the total run time: from the last stage to finish,
+# repeatedly step to the dependency that finished last
+def critical_path(stages, timings):
+    if not timings:
+        return []
+    name = max(timings, key=lambda stage: timings[stage][1])
+    path = [name]
+    while True:
+        dependencies = [dependency for dependency in stages[name][1] if dependency in timings]
+        if not dependencies:
+            break
+        name = max(dependencies, key=lambda stage: timings[stage][1])
+        path.append(name)
+    return path[::-1]
+
+def print_stage_report(stages, timings):
+    total = max((end for _, end in timings.values()), default=0)
+    print(f"{'stage':<30} {'start':>8} {'end':>8} {'seconds':>8}")
+    for name, (start, end) in sorted(timings.items(), key=lambda item: item[1][0]):
+        print(f"{name:<30} {start:>8.1f} {end:>8.1f} {end - start:>8.1f}")
+    path = critical_path(stages, timings)
+    sequential = sum(end - start for start, end in timings.values())
+    print(f"Critical path: {' -> '.join(path)}")
+    print(f"Total {total:.1f}s against {sequential:.1f}s run one after another")
+
+def run_all_backends():
+    # Keep what the stages upload for the Vector Store in memory, up to SPACES_RETAIN_MAX_BYTES, for the stages after them
+    get_uploader().retain_published(prefix, VECTOR_STORE_EXTENSIONS)
+    results, timings, failed = run_stages(STAGES)
+    print_stage_report(STAGES, timings)
+    # Raised so that a scheduled run with a failed or skipped stage exits non-zero
+    if failed:
+        raise RuntimeError(f"Stages failed or skipped: {', '.join(sorted(failed))}")
+    return results
 
 if __name__ == "__main__":
+    configure_logging(LOG_FILE, logging.DEBUG)
     run_all_backends()
@@ -0,0 +1,130 @@
+import argparse
+import glob
+import os
+import random
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+from njit_catalog_scraper import parse_html, save_dir
+
+# Benchmark comparing the single-parse lxml page pipeline with the previous BeautifulSoup pipeline, which parsed
+# every page for its links, again for its course blocks and once more per course block. Run from the backend directory:
+#   python benchmark_course_extraction.py --pages downloaded_html_files
+# Without saved pages, --count synthetic catalog pages of --courses course blocks each are generated instead.
+
+SUBJECTS = ['CS', 'MATH', 'PHYS', 'HUM', 'IS', 'IT', 'ECE', 'MGMT']
+TITLES = ['Roadmap to Computing', 'Data Structures', 'Calculus', 'Technical Writing', 'Database Systems']
+
+# Function to build a synthetic catalog page with the same markup as the live course listings
+def generate_page(course_count, seed=0):
+    rng = random.Random(seed)
+    blocks = []
+    for index in range(course_count):
+        subject = rng.choice(SUBJECTS)
+        description = f"An introduction to {rng.choice(TITLES).lower()} with <a href=\"/search/?P={subject}%20{100 + index}\">{subject}&#160;{100 + index}</a> projects."
+        if rng.random() < 0.6:
+            description += f" Prerequisites: {subject}&#160;{100 + index % 50} with a grade of C or better."
+        if rng.random() < 0.2:
+            description += f" Corequisites: {subject}&#160;{200 + index % 50}."
+        if rng.random() < 0.3:
+            description += " Restrictions: Junior standing."
+        blocks.append(
+            f'<div class="courseblock"><p class="courseblocktitle"><strong>{subject}&#160;{100 + index}. {rng.choice(TITLES)}. '
+            f'{rng.choice([1, 3, 4])} credits, {rng.choice([1, 3, 4])} contact hours.</strong></p>'
+            f'<p class="courseblockdesc">{description}</p></div>'
+        )
+    nav = ''.join(f'<li><a href="/undergraduate/{subject.lower()}/">{subject}</a></li>' for subject in SUBJECTS)
+    return (f'<!DOCTYPE html><html><head><title>Courses</title></head><body><nav><ul>{nav}</ul></nav>'
+            f'<div id="coursestextcontainer">{"".join(blocks)}</div></body></html>')
+
+# Previous implementation, kept here as the baseline
+def legacy_extract(course_blocks):
+    courses = []
+    prereq_pattern = re.compile(r'Prerequisites?:\s*(.*?)(?:\.|$)', re.IGNORECASE)
+    coreq_pattern = re.compile(r'Corequisites?:\s*(.*?)(?:\.|$)', re.IGNORECASE)
+    restrict_pattern = re.compile(r'Restrictions?:\s*(.*?)(?:\.|$)', re.IGNORECASE)
+    for block in course_blocks:
+        soup = BeautifulSoup(str(block), 'html.parser')
+        title_tag = soup.find('p', class_='courseblocktitle')
+        desc_tag = soup.find('p', class_='courseblockdesc')
+        if title_tag and desc_tag:
+            title_text = title_tag.get_text(strip=True).replace('\xa0', ' ')
+            description = desc_tag.get_text(strip=True).replace('\xa0', ' ')
+            course_id = title_text.split('.')[0]
+            title = '.'.join(title_text.split('.')[1:]).strip()
+            prereq_match = prereq_pattern.search(description)
+            prerequisites = prereq_match.group(1).strip() if prereq_match else "None"
+            coreq_match = coreq_pattern.search(description)
+            corequisites = coreq_match.group(1).strip() if coreq_match else "None"
+            restrict_match = restrict_pattern.search(description)
+            restrictions = restrict_match.group(1).strip() if restrict_match else "None"
+            if prereq_match:
+                description = description.replace(prereq_match.group(0), '')
+            if coreq_match:
+                description = description.replace(coreq_match.group(0), '')
+            if restrict_match:
+                description = description.replace(restrict_match.group(0), '')
+            courses.append({
+                'course_id': course_id,
+                'title': title,
+                'description': description.strip(),
+                'prerequisites': prerequisites,
+                'corequisites': corequisites,
+                'restrictions': restrictions
+            })
+    return courses
+
+def legacy_parse(html_content):
+    soup = BeautifulSoup(html_content, 'html.parser')
+    links = [link.get('href') for link in soup.select('a[href]')]
+    courses = []
+    if soup.find('div', id='coursestextcontainer'):
+        soup = BeautifulSoup(html_content, 'html.parser')
+        courses = legacy_extract(soup.find_all('div', class_='courseblock'))
+    return links, courses
+
+def single_parse(html_content):
+    results = parse_html(html_content)
+    return results['links'], results['courses'] or []
+
+def measure(func, pages, repeat):
+    results = None
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        results = [func(page) for page in pages]
+        best = min(best, time.perf_counter() - start_time)
+    return results, best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark catalog page parsing.")
+    parser.add_argument('--pages', default=save_dir, help="Directory of saved catalog HTML pages")
+    parser.add_argument('--count', type=int, default=20, help="Synthetic pages to generate when no pages are saved")
+    parser.add_argument('--courses', type=int, default=150, help="Course blocks per synthetic page")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per parser; the fastest is reported")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.pages, '*.html')))
+    if paths:
+        pages = []
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                pages.append(f.read())
+        print(f"Pages: {len(pages)} from {args.pages}")
+    else:
+        print(f"No pages in {args.pages}, generating {args.count} synthetic pages of {args.courses} courses")
+        pages = [generate_page(args.courses, seed) for seed in range(args.count)]
+
+    legacy_results, legacy_time = measure(legacy_parse, pages, args.repeat)
+    single_results, single_time = measure(single_parse, pages, args.repeat)
+    course_count = sum(len(courses) for _, courses in single_results)
+    print(f"{'parser':>14} {'courses':>8} {'seconds':>8} {'pages/s':>8}")
+    print(f"{'beautifulsoup':>14} {sum(len(courses) for _, courses in legacy_results):>8} {legacy_time:>8.3f} {len(pages) / legacy_time:>8.1f}")
+    print(f"{'lxml single':>14} {course_count:>8} {single_time:>8.3f} {len(pages) / single_time:>8.1f}")
+    print(f"Same courses: {[courses for _, courses in legacy_results] == [courses for _, courses in single_results]}")
+    print(f"Same links: {[links for links, _ in legacy_results] == [links for links, _ in single_results]}")
+
+if __name__ == "__main__":
+    main()
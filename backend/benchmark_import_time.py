@@ -0,0 +1,98 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+# Benchmark of the import time of the backend entry points, measured with `python -X importtime` in a fresh
+# interpreter per run. Each import runs in an empty directory without OPENAI_API_KEY, so it also checks that
+# importing creates no files, configures no logging and needs no credentials. Run from the backend directory:
+#   python benchmark_import_time.py --max-ms 300
+# Modules of the frontend can be measured with --path ../frontend utils.transcript_extractor.
+
+DEFAULT_MODULES = ['backend_runner', 'fetch_and_parse_php_to_dataframe', 'njit_catalog_scraper',
+                   'assistant_resource_allocate', 'spaces_upload', 'http_fetch', 'dataset_formats']
+
+# Statement run after the import: the number of handlers on the root logger, which importing should leave alone
+CHECK_STATEMENT = 'import logging; print(len(logging.getLogger().handlers))'
+
+# Function to parse `-X importtime` output into (depth, name, self microseconds, cumulative microseconds) rows
+def parse_importtime(stderr):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        rows.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+# Function to find the row of a top-level import; `-X importtime` prints each import after the imports it made
+def module_row(rows, module):
+    return next(row for row in reversed(rows) if row[0] == 0 and row[1] == module)
+
+# Function to get the rows of the imports made while importing a module, leaving out interpreter startup
+def imports_of(rows, module):
+    end = rows.index(module_row(rows, module))
+    start = end
+    while start > 0 and rows[start - 1][0] > 0:
+        start -= 1
+    return rows[start:end]
+
+# Function to import a module in a fresh interpreter, returning its import rows, the files the import created
+# and the number of root logging handlers it left configured
+def measure_import(module, path):
+    env = {key: value for key, value in os.environ.items() if key != 'OPENAI_API_KEY'}
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [path, env.get('PYTHONPATH')]))
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}; {CHECK_STATEMENT}'],
+                                cwd=workdir, env=env, capture_output=True, text=True)
+        created = sorted(os.listdir(workdir))
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr.splitlines()[-1] if result.stderr else ''}")
+    handlers = int(result.stdout.strip().splitlines()[-1])
+    return parse_importtime(result.stderr), created, handlers
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time of backend modules.")
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES, help="Modules to import")
+    parser.add_argument('--path', default=os.path.dirname(os.path.abspath(__file__)), help="Directory the modules are imported from")
+    parser.add_argument('--repeat', type=int, default=3, help="Imports per module; the fastest is reported")
+    parser.add_argument('--top', type=int, default=5, help="Heaviest imports listed per module")
+    parser.add_argument('--max-ms', type=float, default=None, help="Fail if a module takes longer than this to import")
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.path)
+    failures = []
+    print(f"{'module':<36} {'ms':>8} {'files':>6} {'handlers':>9}")
+    for module in args.modules:
+        runs = [measure_import(module, path) for _ in range(args.repeat)]
+        rows, created, handlers = min(runs, key=lambda run: module_row(run[0], module)[3])
+        total_ms = module_row(rows, module)[3] / 1000
+        print(f"{module:<36} {total_ms:>8.1f} {len(created):>6} {handlers:>9}")
+        # The heaviest imports made by the module, by cumulative time
+        heaviest = sorted(imports_of(rows, module), key=lambda row: row[3], reverse=True)
+        seen = set()
+        for depth, name, _, cumulative_us in heaviest:
+            top_level = name.split('.')[0]
+            if top_level in seen:
+                continue
+            seen.add(top_level)
+            print(f"    {name:<32} {cumulative_us / 1000:>8.1f}")
+            if len(seen) == args.top:
+                break
+        if created:
+            failures.append(f"{module} created {', '.join(created)} on import")
+        if handlers:
+            failures.append(f"{module} configured {handlers} logging handlers on import")
+        if args.max_ms is not None and total_ms > args.max_ms:
+            failures.append(f"{module} took {total_ms:.1f}ms to import, over {args.max_ms:.1f}ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import io
+import json
+import os
+import random
+import re
+import time
+import tracemalloc
+
+from fetch_and_parse_php_to_dataframe import iter_php_courses, CHUNK_SIZE, url
+
+# Benchmark comparing the streaming JSON parser for datasvc.php with the previous regex + eval() parser.
+# Reports wall time and peak traced memory for both on a captured fixture. Run from the backend directory:
+#   python benchmark_php_parser.py --capture            # save the live datasvc.php body as the fixture
+#   python benchmark_php_parser.py --fixture datasvc.php
+# Without an existing fixture a synthetic file of --courses courses is generated instead.
+
+SUBJECTS = ['CS', 'MATH', 'PHYS', 'HUM', 'IS', 'IT', 'ECE', 'MGMT']
+TITLES = ['Roadmap to Computing', 'Data Structures', 'Calculus', 'Technical Writing', 'Database Systems']
+
+# Function to build a synthetic datasvc.php body with the same layout as the live file
+def generate_fixture(course_count, seed=0):
+    rng = random.Random(seed)
+    courses = []
+    crn = 10000
+    for index in range(course_count):
+        sections = []
+        for section_number in range(1, rng.randint(2, 6)):
+            crn += 1
+            meetings = ', '.join(
+                f'[{rng.randint(2, 6)}, {rng.choice([30600, 36000, 50400])}, {rng.choice([41400, 45000, 59400])}, "GITC {rng.randint(1100, 4400)}"]'
+                for _ in range(rng.randint(1, 3))
+            )
+            sections.append(
+                f'["{section_number:03}", "{section_number:03}", {crn}, "{rng.randint(0, 30)}/30", "Professor, {chr(65 + index % 26)}", '
+                f'null, null, "Notes for section {section_number}", null, [{meetings}]]'
+            )
+        courses.append(f'["{rng.choice(SUBJECTS)} {100 + index % 600}", "{rng.choice(TITLES)}", {rng.choice([1, 3, 4])}, {", ".join(sections)}]')
+    return '{\n  term: "2025 Spring",\n  update: "Oct 17, 2026 10:00 AM",\n  data: [' + ',\n'.join(courses) + '],\n  version: 1\n}\n'
+
+# Previous implementation, kept here as the baseline: whole-body regex match followed by eval()
+def legacy_parse(content):
+    content = content.replace('<?php', '').replace('?>', '').strip()
+    data_match = re.search(r'data:\s*(\[\[.*\]\]),', content, re.DOTALL)
+    term_match = re.search(r'term:\s*"(.*)"', content)
+    update_match = re.search(r'update:\s*"(.*)"', content)
+    data_str = data_match.group(1)
+    data_str = data_str.replace('null', 'None')
+    data = eval(data_str)
+    return data, term_match.group(1), update_match.group(1)
+
+def streaming_parse(path):
+    metadata = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        chunks = iter(lambda: f.read(CHUNK_SIZE), '')
+        data = list(iter_php_courses(chunks, metadata))
+    return data, metadata['term'], metadata['update']
+
+def legacy_from_file(path):
+    # Mirrors the old code path, which held the full response body in memory
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return legacy_parse(content)
+
+def measure(func, path):
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    result = func(path)
+    elapsed = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark datasvc.php parsing.")
+    parser.add_argument('--fixture', default='datasvc_fixture.php', help="Path of the captured datasvc.php body")
+    parser.add_argument('--capture', action='store_true', help="Download the live datasvc.php body to the fixture path first")
+    parser.add_argument('--courses', type=int, default=3000, help="Courses in the synthetic fixture when none is captured")
+    args = parser.parse_args()
+
+    if args.capture:
+        import requests
+        with requests.get(url, stream=True) as response, open(args.fixture, 'wb') as f:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+    if not os.path.exists(args.fixture):
+        print(f"No fixture at {args.fixture}, generating {args.courses} synthetic courses")
+        with io.open(args.fixture, 'w', encoding='utf-8') as f:
+            f.write(generate_fixture(args.courses))
+    print(f"Fixture: {args.fixture} ({os.path.getsize(args.fixture) / 1024 / 1024:.1f} MiB)")
+
+    legacy_result, legacy_time, legacy_peak = measure(legacy_from_file, args.fixture)
+    streaming_result, streaming_time, streaming_peak = measure(streaming_parse, args.fixture)
+    print(f"{'parser':>10} {'courses':>8} {'seconds':>8} {'peak MiB':>9}")
+    print(f"{'eval':>10} {len(legacy_result[0]):>8} {legacy_time:>8.3f} {legacy_peak / 1024 / 1024:>9.1f}")
+    print(f"{'streaming':>10} {len(streaming_result[0]):>8} {streaming_time:>8.3f} {streaming_peak / 1024 / 1024:>9.1f}")
+    print(f"Same term and update: {legacy_result[1:] == streaming_result[1:]}")
+    print(f"Same courses: {json.dumps(legacy_result[0]) == json.dumps(streaming_result[0])}")
+
+if __name__ == "__main__":
+    main()
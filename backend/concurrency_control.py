@@ -0,0 +1,220 @@
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bounds of the shared limiters; each starts at its initial limit and adapts between the minimum and maximum
+OPENAI_INITIAL_CONCURRENCY = int(os.getenv('OPENAI_INITIAL_CONCURRENCY', 5))
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', 32))
+SPACES_INITIAL_CONCURRENCY = int(os.getenv('SPACES_INITIAL_CONCURRENCY', 16))
+SPACES_MAX_CONCURRENCY = int(os.getenv('SPACES_MAX_CONCURRENCY', 64))
+
+# Throttled calls are retried this many times; without a retry-after hint the wait is drawn with full jitter
+THROTTLE_MAX_RETRIES = int(os.getenv('THROTTLE_MAX_RETRIES', 5))
+THROTTLE_BASE_DELAY = 1
+THROTTLE_MAX_DELAY = 60
+
+# Other failed OpenAI calls (timeouts, conflicts, server errors and dropped connections) are retried this many
+# times with the same backoff as the SDK's own retries, which are turned off; they leave the limit alone
+OPENAI_RETRIES = int(os.getenv('OPENAI_RETRIES', 2))
+OPENAI_RETRY_BASE_DELAY = 0.5
+OPENAI_RETRY_MAX_DELAY = 8
+OPENAI_RETRYABLE_STATUS_CODES = {408, 409}
+
+THROTTLE_STATUS_CODES = {429, 503}
+THROTTLE_ERROR_CODES = {'SlowDown', 'Throttling', 'ThrottlingException', 'TooManyRequests', 'RequestLimitExceeded', 'ServiceUnavailable'}
+DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+# Function to parse a rate-limit reset duration such as "1s", "6m0s" or "250ms" into seconds
+def parse_duration(value):
+    matches = DURATION_PATTERN.findall(value)
+    if not matches:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in matches)
+
+# Function to read the seconds to wait from retry-after and rate-limit reset headers, or None without a hint
+def retry_after_from_headers(headers):
+    if not headers:
+        return None
+    headers = {key.lower(): value for key, value in headers.items()}
+    if headers.get('retry-after-ms'):
+        try:
+            return float(headers['retry-after-ms']) / 1000
+        except ValueError:
+            pass
+    if headers.get('retry-after'):
+        try:
+            return float(headers['retry-after'])
+        except ValueError:
+            pass # An HTTP date; fall through to the reset headers
+    resets = [parse_duration(headers[key]) for key in ('x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens') if headers.get(key)]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
+
+# Function to classify an exception from the OpenAI or S3 clients, returning (throttled, retry_after)
+def throttle_info(error):
+    # OpenAI errors carry the HTTP response
+    response = getattr(error, 'response', None)
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None:
+        headers = getattr(response, 'headers', None)
+        return status_code in THROTTLE_STATUS_CODES, retry_after_from_headers(headers)
+    # botocore ClientErrors carry the parsed response as a dict
+    if isinstance(response, dict):
+        code = response.get('Error', {}).get('Code')
+        metadata = response.get('ResponseMetadata', {})
+        throttled = code in THROTTLE_ERROR_CODES or metadata.get('HTTPStatusCode') in THROTTLE_STATUS_CODES
+        return throttled, retry_after_from_headers(metadata.get('HTTPHeaders'))
+    return False, None
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit shared by every worker pool calling one service, adjusted by additive increase and
+    multiplicative decrease (AIMD).
+
+    Each successful call adds 1/limit to the limit, so it grows by about one per round of calls, up to
+    `max_limit`. A throttled call (429/503, SlowDown) multiplies it by `backoff_factor`, at most once per
+    `cooldown` seconds, down to `min_limit`; a retry-after hint also pauses new calls until it passes.
+    Executors should be sized to `max_limit` and run their calls through `call`, so the limiter, not the
+    thread count, decides how many run at once.
+    """
+
+    def __init__(self, name, initial_limit, min_limit=1, max_limit=64, backoff_factor=0.5, cooldown=1.0):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.backoff_factor = backoff_factor
+        self.cooldown = cooldown
+        self.limit = float(min(max(initial_limit, min_limit), self.max_limit))
+        self.in_flight = 0
+        self.stats = {'calls': 0, 'throttled': 0, 'decreases': 0, 'peak_limit': self.limit, 'min_seen_limit': self.limit}
+        self._paused_until = 0
+        self._last_decrease = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                elif self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                else:
+                    self._condition.wait()
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def record_success(self):
+        with self._condition:
+            self.stats['calls'] += 1
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.stats['peak_limit'] = max(self.stats['peak_limit'], self.limit)
+            self._condition.notify_all()
+
+    def record_throttle(self, retry_after=None):
+        now = time.monotonic()
+        with self._condition:
+            self.stats['throttled'] += 1
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit * self.backoff_factor)
+                self._last_decrease = now
+                self.stats['decreases'] += 1
+                self.stats['min_seen_limit'] = min(self.stats['min_seen_limit'], self.limit)
+                logger.info(f"{self.name} throttled, concurrency limit lowered to {int(self.limit)}")
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def call(self, func, *args, max_retries=THROTTLE_MAX_RETRIES, **kwargs):
+        """
+        Run `func(*args, **kwargs)` within the limit, retrying it when it is throttled. Other errors,
+        and throttling past `max_retries`, are raised to the caller.
+        """
+        for attempt in range(max_retries + 1):
+            self.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.release()
+                throttled, retry_after = throttle_info(e)
+                if not throttled:
+                    raise
+                self.record_throttle(retry_after)
+                if attempt == max_retries:
+                    raise
+                if retry_after is None:
+                    time.sleep(random.uniform(0, min(THROTTLE_MAX_DELAY, THROTTLE_BASE_DELAY * 2 ** attempt)))
+                continue
+            self.release()
+            self.record_success()
+            return result
+
+    def log_stats(self):
+        with self._condition:
+            stats = dict(self.stats)
+            limit = self.limit
+        logger.info(f"{self.name} concurrency: {stats['calls']} calls, {stats['throttled']} throttled, "
+                    f"{stats['decreases']} decreases, limit now {int(limit)} "
+                    f"(ranged {int(stats['min_seen_limit'])}-{int(stats['peak_limit'])})")
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+LIMITER_SETTINGS = {
+    'openai': {'initial_limit': OPENAI_INITIAL_CONCURRENCY, 'max_limit': OPENAI_MAX_CONCURRENCY},
+    'spaces': {'initial_limit': SPACES_INITIAL_CONCURRENCY, 'max_limit': SPACES_MAX_CONCURRENCY}
+}
+
+# Function to get the process-wide limiter of a service ("openai" or "spaces"), shared by every worker pool
+def get_limiter(name):
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = AdaptiveLimiter(name, **LIMITER_SETTINGS[name])
+        return _limiters[name]
+
+# Function to log the stats of every limiter used so far
+def log_limiter_stats():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    for limiter in limiters:
+        limiter.log_stats()
+
+# Function to tell whether a failed OpenAI call is worth retrying, as the SDK decides it; throttling is left to the limiter
+def is_transient_openai_error(error):
+    import openai
+    if isinstance(error, openai.APIConnectionError): # Includes timeouts
+        return True
+    if isinstance(error, openai.APIStatusError) and not throttle_info(error)[0]:
+        return error.status_code in OPENAI_RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+# Function to call an OpenAI client method within the shared "openai" limit, retrying transient errors with
+# exponential backoff and full jitter; throttling is retried by the limiter, which also lowers the limit
+def call_openai(func, *args, retries=OPENAI_RETRIES, **kwargs):
+    for attempt in range(retries + 1):
+        try:
+            return get_limiter('openai').call(func, *args, **kwargs)
+        except Exception as e:
+            if attempt == retries or not is_transient_openai_error(e):
+                raise
+            delay = random.uniform(0, min(OPENAI_RETRY_MAX_DELAY, OPENAI_RETRY_BASE_DELAY * 2 ** attempt))
+            logger.warning(f"{getattr(func, '__qualname__', func)} failed ({e}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+# Generator yielding the items of a paginated OpenAI list call, fetching every page through call_openai
+def iter_openai_items(func, *args, **kwargs):
+    page = call_openai(func, *args, **kwargs)
+    while True:
+        yield from page.data
+        if not page.has_next_page():
+            break
+        page = call_openai(page.get_next_page)
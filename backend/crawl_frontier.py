@@ -0,0 +1,93 @@
+import logging
+import os
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+# Crawl budgets and allow-lists; by default only the hosts of the seed URLs are crawled
+CRAWL_MAX_DEPTH = int(os.getenv('CRAWL_MAX_DEPTH', 1))
+CRAWL_MAX_PAGES = int(os.getenv('CRAWL_MAX_PAGES', 2000))
+CRAWL_ALLOWED_DOMAINS = [domain.strip().lower() for domain in os.getenv('CRAWL_ALLOWED_DOMAINS', '').split(',') if domain.strip()]
+CRAWL_ALLOWED_PATHS = [path.strip() for path in os.getenv('CRAWL_ALLOWED_PATHS', '').split(',') if path.strip()]
+
+# Links to files that are not HTML pages
+SKIPPED_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.zip', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.mp4')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Function to normalize a URL for fetching: lowercase scheme and host, no default port or fragment, sorted query
+def canonicalize_url(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc += f':{parts.port}'
+    path = parts.path or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+# Function to build the dedupe key of a canonical URL, which also treats a trailing slash as insignificant
+def url_key(canonical_url):
+    parts = urlsplit(canonical_url)
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme, parts.netloc, path, parts.query, ''))
+
+class CrawlFrontier:
+    """
+    Shared record of the URLs a crawl has accepted, deduplicated across every seed.
+
+    `add` returns the canonical URL to fetch, or None if the URL was already seen, is outside the
+    allowed domains and paths, or exceeds the depth or page budget. Safe to call from threads and tasks.
+    """
+
+    def __init__(self, seed_urls, max_depth=CRAWL_MAX_DEPTH, max_pages=CRAWL_MAX_PAGES,
+                 allowed_domains=None, allowed_paths=None):
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.allowed_domains = set(allowed_domains or CRAWL_ALLOWED_DOMAINS
+                                   or (urlsplit(canonicalize_url(url)).hostname for url in seed_urls))
+        self.allowed_paths = list(allowed_paths or CRAWL_ALLOWED_PATHS)
+        self.stats = {'discovered': 0, 'accepted': 0, 'duplicates': 0, 'off_domain': 0,
+                      'disallowed_path': 0, 'too_deep': 0, 'over_budget': 0}
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def is_allowed(self, canonical_url):
+        parts = urlsplit(canonical_url)
+        if parts.scheme not in DEFAULT_PORTS or parts.hostname not in self.allowed_domains:
+            return 'off_domain'
+        if parts.path.lower().endswith(SKIPPED_EXTENSIONS):
+            return 'disallowed_path'
+        if self.allowed_paths and not any(parts.path.startswith(path) for path in self.allowed_paths):
+            return 'disallowed_path'
+        return None
+
+    def add(self, url, depth):
+        canonical_url = canonicalize_url(url)
+        key = url_key(canonical_url)
+        with self._lock:
+            self.stats['discovered'] += 1
+            rejection = self.is_allowed(canonical_url)
+            if rejection is None and key in self._seen:
+                rejection = 'duplicates'
+            if rejection is None and depth > self.max_depth:
+                rejection = 'too_deep'
+            if rejection is None and len(self._seen) >= self.max_pages:
+                rejection = 'over_budget'
+            if rejection is not None:
+                self.stats[rejection] += 1
+                return None
+            self._seen.add(key)
+            self.stats['accepted'] += 1
+            return canonical_url
+
+    def can_follow(self, depth):
+        # Links found on a page at this depth would be beyond the depth budget
+        return depth < self.max_depth
+
+    def log_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        logger.info(f"Crawl frontier stats: {stats['accepted']} pages accepted of {stats['discovered']} links discovered; "
+                    f"fetches saved: {stats['duplicates']} duplicates, {stats['off_domain']} off-domain, "
+                    f"{stats['disallowed_path']} disallowed paths, {stats['too_deep']} too deep, {stats['over_budget']} over budget")
@@ -0,0 +1,172 @@
+import gzip
+import io
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Formats published for each dataset, e.g. DATASET_FORMATS=json,jsonl,parquet
+DATASET_FORMATS = [fmt.strip() for fmt in os.getenv('DATASET_FORMATS', 'json,jsonl,parquet').split(',') if fmt.strip()]
+
+# Schema metadata key holding the dataset metadata in Parquet and Arrow files
+ARROW_METADATA_KEY = b'dataset_metadata'
+
+# Function to import pyarrow only when a columnar format is requested, since it is an optional dependency
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+        return pyarrow
+    except ImportError:
+        return None
+
+# Function to convert a DataFrame to an Arrow table carrying the dataset metadata
+def to_arrow_table(pa, df, metadata):
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # Columns mixing numbers and text (e.g. variable credits) are stored as text
+        df = df.copy()
+        for column in df.columns[df.dtypes == object]:
+            df[column] = df[column].map(lambda value: value if value is None else str(value))
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    schema_metadata = dict(table.schema.metadata or {})
+    schema_metadata[ARROW_METADATA_KEY] = json.dumps(metadata or {}).encode('utf-8')
+    return table.replace_schema_metadata(schema_metadata)
+
+# Function to read the dataset metadata back from an Arrow table
+def from_arrow_table(table):
+    metadata = json.loads((table.schema.metadata or {}).get(ARROW_METADATA_KEY, b'{}'))
+    return table.to_pandas(), metadata
+
+def encode_json(df, metadata, records_key):
+    # The metadata keys come first, followed by the records, e.g. {"term": ..., "sections": [...]}
+    parts = [json.dumps(key) + ':' + json.dumps(value) for key, value in (metadata or {}).items()]
+    parts.append(json.dumps(records_key) + ':' + df.to_json(orient='records'))
+    return ('{' + ','.join(parts) + '}').encode('utf-8')
+
+def decode_json(body, records_key):
+    import pandas as pd
+    content = json.loads(body)
+    records = content.pop(records_key, [])
+    return pd.DataFrame.from_records(records), content
+
+def encode_jsonl(df, metadata, records_key):
+    # An optional first line holds the metadata, followed by one record per line
+    header = json.dumps({'metadata': metadata}) + '\n' if metadata else ''
+    return (header + (df.to_json(orient='records', lines=True) if len(df) else '')).encode('utf-8')
+
+def decode_jsonl(body, records_key):
+    import pandas as pd
+    lines = [line for line in body.decode('utf-8').splitlines() if line.strip()]
+    metadata = {}
+    if lines:
+        first = json.loads(lines[0])
+        if list(first) == ['metadata']:
+            metadata = first['metadata']
+            lines = lines[1:]
+    return pd.DataFrame.from_records([json.loads(line) for line in lines]), metadata
+
+def encode_parquet(df, metadata, records_key):
+    pa = import_pyarrow()
+    sink = io.BytesIO()
+    pa.parquet.write_table(to_arrow_table(pa, df, metadata), sink, compression='zstd')
+    return sink.getvalue()
+
+def decode_parquet(body, records_key):
+    pa = import_pyarrow()
+    return from_arrow_table(pa.parquet.read_table(io.BytesIO(body)))
+
+def encode_arrow(df, metadata, records_key):
+    pa = import_pyarrow()
+    table = to_arrow_table(pa, df, metadata)
+    sink = io.BytesIO()
+    with pa.ipc.new_file(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression='zstd')) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def decode_arrow(body, records_key):
+    pa = import_pyarrow()
+    return from_arrow_table(pa.ipc.open_file(io.BytesIO(body)).read_all())
+
+# Output formats by name. JSON formats are gzip-encoded on upload; the columnar formats are compressed internally.
+FORMATS = {
+    'json': {
+        'extension': '.json',
+        'content_type': 'application/json',
+        'content_encoding': 'gzip',
+        'requires_pyarrow': False,
+        'encode': encode_json,
+        'decode': decode_json
+    },
+    'jsonl': {
+        'extension': '.jsonl',
+        'content_type': 'application/x-ndjson',
+        'content_encoding': 'gzip',
+        'requires_pyarrow': False,
+        'encode': encode_jsonl,
+        'decode': decode_jsonl
+    },
+    'parquet': {
+        'extension': '.parquet',
+        'content_type': 'application/vnd.apache.parquet',
+        'content_encoding': None,
+        'requires_pyarrow': True,
+        'encode': encode_parquet,
+        'decode': decode_parquet
+    },
+    'arrow': {
+        'extension': '.arrow',
+        'content_type': 'application/vnd.apache.arrow.file',
+        'content_encoding': None,
+        'requires_pyarrow': True,
+        'encode': encode_arrow,
+        'decode': decode_arrow
+    }
+}
+
+# Function to encode a DataFrame into one format, returning the object name suffix, body and headers
+def encode_dataset(df, fmt, metadata=None, records_key='records'):
+    output_format = FORMATS[fmt]
+    body = output_format['encode'](df, metadata, records_key)
+    if output_format['content_encoding'] == 'gzip':
+        body = gzip.compress(body, mtime=0) # A fixed mtime keeps identical content byte-identical
+    return output_format['extension'], body, output_format['content_type'], output_format['content_encoding']
+
+# Function to publish a DataFrame in each output format through `upload(body, object_name, content_type, content_encoding)`
+def publish_dataset(df, name, upload, metadata=None, formats=None, records_key='records'):
+    formats = DATASET_FORMATS if formats is None else formats
+    has_pyarrow = import_pyarrow() is not None
+    published = []
+    for fmt in formats:
+        if fmt not in FORMATS:
+            logger.error(f"Unknown dataset format: {fmt}")
+            continue
+        if FORMATS[fmt]['requires_pyarrow'] and not has_pyarrow:
+            logger.warning(f"Skipping {fmt} output for {name}: pyarrow is not installed")
+            continue
+        extension, body, content_type, content_encoding = encode_dataset(df, fmt, metadata, records_key)
+        upload(body, name + extension, content_type, content_encoding)
+        published.append(name + extension)
+        logger.info(f"Published {name + extension} ({len(body)} bytes)")
+    return published
+
+# Function to undo the Content-Encoding of an object body; boto3 does not decompress bodies itself
+def decode_body(body, content_encoding=None):
+    if content_encoding == 'gzip' or body[:2] == b'\x1f\x8b':
+        return gzip.decompress(body)
+    return body
+
+# Function to read a published dataset back into a DataFrame and its metadata
+def read_dataset(body, object_name, content_encoding=None, records_key='records'):
+    for output_format in FORMATS.values():
+        if object_name.endswith(output_format['extension']):
+            return output_format['decode'](decode_body(body, content_encoding), records_key)
+    raise ValueError(f"Unknown dataset format for {object_name}")
+
+# Function to download and read a published dataset from Digital Ocean Spaces
+def read_dataset_from_spaces(s3_client, bucket, key, records_key='records'):
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    return read_dataset(response['Body'].read(), key, response.get('ContentEncoding'), records_key)
@@ -0,0 +1,23 @@
+import logging
+import threading
+
+DOTENV_PATH = '../.env'
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_loaded = False
+_loaded_lock = threading.Lock()
+
+# Function to load ../.env into the process environment, once per process. Client factories call it before
+# reading credentials, so importing a backend module reads no files.
+def load_environment():
+    global _loaded
+    with _loaded_lock:
+        if not _loaded:
+            from dotenv import load_dotenv
+            load_dotenv(dotenv_path=DOTENV_PATH, override=True)
+            _loaded = True
+
+# Function to send the logs of a run to a file, truncating the log of the previous run. Only entry points
+# call it; a module that is merely imported leaves the logging configuration alone.
+def configure_logging(filename, level=logging.INFO):
+    logging.basicConfig(level=level, format=LOG_FORMAT, handlers=[logging.FileHandler(filename, 'w', 'utf-8')])
@@ -1,120 +1,248 @@
-import pandas as pd
+import gzip
+import json
 import re
 import os
-import boto3
-from botocore.exceptions import NoCredentialsError
-from dotenv import load_dotenv
-import requests
-
-# Load environment variables
-load_dotenv(dotenv_path='../.env', override=True)
-
-# Get Digital Ocean credentials from environment variables
-DO_SPACES_KEY = os.getenv('DO_SPACES_KEY')
-DO_SPACES_SECRET = os.getenv('DO_SPACES_SECRET')
-DO_SPACES_REGION = os.getenv('DO_SPACES_REGION', 'nyc3')
-DO_SPACES_ENDPOINT = os.getenv('DO_SPACES_ENDPOINT', 'https://nyc3.digitaloceanspaces.com')
-DO_SPACES_BUCKET = os.getenv('DO_SPACES_BUCKET')
-
-# Configure the boto3 client
-session = boto3.session.Session()
-client = session.client('s3',
-                        region_name=DO_SPACES_REGION,
-                        endpoint_url=DO_SPACES_ENDPOINT,
-                        aws_access_key_id=DO_SPACES_KEY,
-                        aws_secret_access_key=DO_SPACES_SECRET)
+import time
+from environment import load_environment
+
+# Run standalone, ../.env is loaded before FULL_SNAPSHOT_INTERVAL and the upload settings are read
+if __name__ == "__main__":
+    load_environment()
+
+import http_fetch
+from dataset_formats import DATASET_FORMATS, decode_body, publish_dataset
+from spaces_upload import call_spaces, spaces_bucket, start_upload_group, submit_upload, wait_for_uploads
 
 prefix = 'course_data/'
+state_prefix = 'state/' # Previous snapshot used to compute deltas, kept out of the Vector Store
+delta_prefix = 'deltas/upcoming_semester_courses/'
+
+# Key of the previous snapshot and the minimum seconds between full snapshots while only deltas change
+STATE_OBJECT_NAME = 'upcoming_semester_courses.json'
+FULL_SNAPSHOT_INTERVAL = int(os.getenv('FULL_SNAPSHOT_INTERVAL', 6 * 60 * 60))
 
 # URL of the PHP file
 url = 'https://myhub.njit.edu/scbldr/include/datasvc.php?p=/'
 
-def upload_to_digital_ocean_space(file_content, object_name, content_type):
-    try:
-        client.put_object(
-            Bucket=DO_SPACES_BUCKET,
-            Key=prefix + object_name,
-            Body=file_content,
-            ContentType=content_type
-        )
-        print(f"Successfully uploaded {object_name} to {DO_SPACES_BUCKET}/{prefix}")
-    except NoCredentialsError:
-        print("Credentials not available")
+# Function to queue a file for upload to Digital Ocean Spaces on the shared uploader
+def upload_to_digital_ocean_space(file_content, object_name, content_type, content_encoding=None, key_prefix=prefix):
+    submit_upload(spaces_bucket(), key_prefix + object_name, file_content, content_type, content_encoding)
+    print(f"Queued upload of {object_name} to {spaces_bucket()}/{key_prefix}")
+
+# Patterns for locating the course data array and the term metadata in the PHP file content
+DATA_START_PATTERN = re.compile(r'data:\s*\[')
+SEPARATOR_PATTERN = re.compile(r'[\s,]*')
+TERM_PATTERN = re.compile(r'term:\s*"(.*)"')
+UPDATE_PATTERN = re.compile(r'update:\s*"(.*)"')
+
+# Size of the chunks read from the response
+CHUNK_SIZE = 64 * 1024
+
+# Function to read the term and update values from the text around the data array
+def read_php_metadata(text, metadata):
+    term_match = TERM_PATTERN.search(text)
+    update_match = UPDATE_PATTERN.search(text)
+    if term_match and 'term' not in metadata:
+        metadata['term'] = term_match.group(1)
+    if update_match and 'update' not in metadata:
+        metadata['update'] = update_match.group(1)
+
+# Generator that decodes the courses of the data array one at a time from chunks of the PHP file content.
+# The array is JSON apart from its `data:` label, so each course is decoded with a JSON decoder as soon as
+# it has been fully read; term and update found around the array are stored in `metadata`.
+def iter_php_courses(chunks, metadata):
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ''
+
+    # Read up to the start of the data array
+    match = DATA_START_PATTERN.search(buffer)
+    while not match:
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise ValueError("The PHP file format is incorrect or has changed.")
+        buffer += chunk
+        match = DATA_START_PATTERN.search(buffer)
+    read_php_metadata(buffer[:match.start()], metadata)
+    position = match.end()
+
+    # Decode one course at a time, reading more content whenever the buffer ends mid-course
+    while True:
+        position = SEPARATOR_PATTERN.match(buffer, position).end()
+        if position < len(buffer) and buffer[position] == ']':
+            break
+        try:
+            if position >= len(buffer):
+                raise json.JSONDecodeError("Buffer exhausted", buffer, position)
+            course, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise ValueError("The PHP file format is incorrect or has changed.")
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield course
+
+    # Term and update may also follow the data array; the rest is read in any case so the response is fully consumed
+    read_php_metadata(buffer[position + 1:] + ''.join(chunks), metadata)
 
 # Define a function to fetch and parse the PHP file content into structured data
 def fetch_and_parse_php_file(url):
-    response = requests.get(url)
-    content = response.text
-    
-    # Remove PHP tags and clean up the content
-    content = content.replace('<?php', '').replace('?>', '').strip()
-    
-    # Extract the data section using regular expressions
-    data_match = re.search(r'data:\s*(\[\[.*\]\]),', content, re.DOTALL)
-    term_match = re.search(r'term:\s*"(.*)"', content)
-    update_match = re.search(r'update:\s*"(.*)"', content)
-    
-    if data_match and term_match and update_match:
-        data_str = data_match.group(1)
-        data_str = data_str.replace('null', 'None')
-        data = eval(data_str)
-        term = term_match.group(1)
-        update = update_match.group(1)
-        return data, term, update
+    metadata = {}
+    data = list(iter_php_courses(http_fetch.iter_fetch(url, chunk_size=CHUNK_SIZE, decode_unicode=True), metadata))
+
+    if 'term' in metadata and 'update' in metadata:
+        return data, metadata['term'], metadata['update']
     else:
         raise ValueError("The PHP file format is incorrect or has changed.")
 
-# Function to convert seconds into HH:MM format
-def convert_seconds_to_time(seconds):
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
-    return f"{hours:02}:{minutes:02}"
+# Columns of the sections table, one row per section
+SECTION_COLUMNS = [
+    'Course Code', 'Course Name', 'Credits', 'Section Code', 'Section Number', 'CRN',
+    'Enrollment', 'Professor', 'Notes'
+]
+# Columns of the meetings table, one row per scheduled meeting of a section
+MEETING_COLUMNS = ['CRN', 'Day', 'Start Seconds', 'End Seconds', 'Location']
+# The meetings table is only for downstream filtering, so it is not published as JSON for the vector store
+MEETINGS_FORMATS = [fmt for fmt in DATASET_FORMATS if fmt != 'json']
+# Formats of the sections republished on every change between full snapshots: the copy the vector store indexes
+CHANGED_SECTIONS_FORMATS = [fmt for fmt in DATASET_FORMATS if fmt == 'json']
+DAY_NAMES = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
 
-# Function to convert day integer to day string
-def convert_day_to_string(day):
-    days = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
-    return days[day-1]
+# Function to convert a column to numbers, keeping it as is if any value is not numeric (e.g. variable credits)
+def convert_numeric_column(column):
+    import pandas as pd
+    converted = pd.to_numeric(column, errors='coerce')
+    if converted.isna().sum() > column.isna().sum():
+        return column
+    return converted
 
-# Define function to convert parsed data to DataFrame
-def convert_to_dataframe(parsed_data, term, update):
-    columns = [
-        'Course Code', 'Course Name', 'Credits', 'Section Code', 'Section Number', 'CRN',
-        'Enrollment', 'Professor', 'Notes', 'Schedule'
-    ]
-    df_data = []
+# Function to build the sections and meetings tables column by column from the parsed data
+def build_course_tables(parsed_data):
+    import pandas as pd
+    sections = {column: [] for column in SECTION_COLUMNS}
+    meetings = {column: [] for column in MEETING_COLUMNS}
     for course in parsed_data:
-        course_code = course[0]
-        course_name = course[1]
-        credits = course[2]
-        sections = course[3:]
-        for section in sections:
-            section_code = section[0]
-            section_number = section[1]
+        course_code, course_name, credits = course[0], course[1], course[2]
+        for section in course[3:]:
             crn = section[2]
-            enrollment = section[3]
-            professor = section[4]
-            notes = section[7]
-            schedule_list = section[9]
-            schedule = []
-            for sched in schedule_list:
-                day_str = convert_day_to_string(sched[0])
-                start_time = convert_seconds_to_time(sched[1])
-                end_time = convert_seconds_to_time(sched[2])
-                location = sched[3]
-                schedule.append(f"{day_str} {start_time}-{end_time} at {location}")
-            
-            df_data.append([
-                course_code, course_name, credits, section_code, section_number, crn,
-                enrollment, professor, notes, "; ".join(schedule)
-            ])
-        # Add term and update information
-        df_data.append(['', '', '', '', '', '', '', '', '', ''])
-        df_data.append(['Term:', term, '', '', '', '', '', '', '', ''])
-        df_data.append(['Last Updated:', update, '', '', '', '', '', '', '', ''])
-    
-    df = pd.DataFrame(df_data, columns=columns)
-    object_name = f'upcoming_semester_courses.json' 
-    upload_to_digital_ocean_space(df.to_json(), object_name, 'application/json')
+            sections['Course Code'].append(course_code)
+            sections['Course Name'].append(course_name)
+            sections['Credits'].append(credits)
+            sections['Section Code'].append(section[0])
+            sections['Section Number'].append(section[1])
+            sections['CRN'].append(crn)
+            sections['Enrollment'].append(section[3])
+            sections['Professor'].append(section[4])
+            sections['Notes'].append(section[7])
+            for sched in section[9]:
+                meetings['CRN'].append(crn)
+                meetings['Day'].append(sched[0])
+                meetings['Start Seconds'].append(sched[1])
+                meetings['End Seconds'].append(sched[2])
+                meetings['Location'].append(sched[3])
+
+    sections_df = pd.DataFrame(sections, columns=SECTION_COLUMNS)
+    for column in ('Credits', 'CRN', 'Enrollment'):
+        sections_df[column] = convert_numeric_column(sections_df[column])
+
+    meetings_df = pd.DataFrame(meetings, columns=MEETING_COLUMNS)
+    meetings_df['CRN'] = convert_numeric_column(meetings_df['CRN'])
+    for column in ('Day', 'Start Seconds', 'End Seconds'):
+        meetings_df[column] = pd.to_numeric(meetings_df[column], errors='coerce').astype('Int64')
+    return sections_df, meetings_df
+
+# Function to format a column of seconds into HH:MM strings
+def format_seconds_as_time(seconds):
+    hours = (seconds // 3600).astype(str).str.zfill(2)
+    minutes = (seconds % 3600 // 60).astype(str).str.zfill(2)
+    return hours + ':' + minutes
+
+# Function to format each section's meetings into a "Mon 10:00-11:30 at GITC 1100; ..." schedule string keyed by CRN
+def format_schedules(meetings_df):
+    import pandas as pd
+    if meetings_df.empty:
+        return pd.Series(dtype=str)
+    days = pd.Series(DAY_NAMES).reindex((meetings_df['Day'] - 1) % 7).set_axis(meetings_df.index)
+    slots = (days + ' ' + format_seconds_as_time(meetings_df['Start Seconds'])
+             + '-' + format_seconds_as_time(meetings_df['End Seconds'])
+             + ' at ' + meetings_df['Location'].astype(str))
+    return slots.groupby(meetings_df['CRN'], sort=False).agg('; '.join)
+
+# Function to load the previous snapshot of the sections keyed by CRN, or None on the first run
+def load_previous_snapshot():
+    from botocore.exceptions import ClientError
+    try:
+        response = call_spaces('get_object', Bucket=spaces_bucket(), Key=state_prefix + STATE_OBJECT_NAME)
+        return json.loads(decode_body(response['Body'].read(), response.get('ContentEncoding')))
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return None
+        raise
+
+# Function to save the current snapshot for the next run's delta
+def save_snapshot(snapshot):
+    body = gzip.compress(json.dumps(snapshot).encode('utf-8'), mtime=0)
+    upload_to_digital_ocean_space(body, STATE_OBJECT_NAME, 'application/json', 'gzip', key_prefix=state_prefix)
+
+# Function to compute the sections added, removed and changed between two snapshots keyed by CRN
+def compute_section_delta(previous_sections, current_sections):
+    added = [section for crn, section in current_sections.items() if crn not in previous_sections]
+    removed = [crn for crn in previous_sections if crn not in current_sections]
+    changed = [section for crn, section in current_sections.items()
+               if crn in previous_sections and previous_sections[crn] != section]
+    return {'added': added, 'removed': removed, 'changed': changed}
+
+# Function to publish the full sections and meetings datasets
+def publish_full_snapshot(sections_df, meetings_df, metadata):
+    publish_dataset(sections_df, 'upcoming_semester_courses', upload_to_digital_ocean_space,
+                    metadata=metadata, records_key='sections')
+    publish_dataset(meetings_df, 'upcoming_semester_meetings', upload_to_digital_ocean_space,
+                    metadata=metadata, formats=MEETINGS_FORMATS)
+
+# Define function to convert parsed data to DataFrames and publish what changed since the previous run.
+# A full snapshot is published on the first run, when the term changes, and at most every FULL_SNAPSHOT_INTERVAL
+# seconds. In between, a change republishes only the sections JSON indexed by the vector store, next to a delta
+# of the added, removed and changed sections. The snapshot is saved only once the publish has succeeded, so a
+# failed run is published again by the next one.
+def convert_to_dataframe(parsed_data, term, update):
+    # The uploads of this publish get their own group, so only their failures decide whether the snapshot is saved
+    start_upload_group()
+    sections_df, meetings_df = build_course_tables(parsed_data)
+    sections_df['Schedule'] = sections_df['CRN'].map(format_schedules(meetings_df)).fillna('')
+    metadata = {'term': term, 'last_updated': update}
+
+    current_sections = {str(section['CRN']): section for section in json.loads(sections_df.to_json(orient='records'))}
+    previous = load_previous_snapshot()
+    now = time.time()
+    if previous is None or previous.get('term') != term:
+        publish_full_snapshot(sections_df, meetings_df, metadata)
+        last_full_publish = now
+    else:
+        delta = compute_section_delta(previous['sections'], current_sections)
+        if not any(delta.values()):
+            print(f"No section changes since {previous.get('last_updated')}, skipping upload")
+            return sections_df, meetings_df
+        print(f"Section changes: {len(delta['added'])} added, {len(delta['removed'])} removed, {len(delta['changed'])} changed")
+        last_full_publish = previous.get('last_full_publish', 0)
+        if now - last_full_publish >= FULL_SNAPSHOT_INTERVAL:
+            publish_full_snapshot(sections_df, meetings_df, metadata)
+            last_full_publish = now
+        else:
+            publish_dataset(sections_df, 'upcoming_semester_courses', upload_to_digital_ocean_space,
+                            metadata=metadata, formats=CHANGED_SECTIONS_FORMATS, records_key='sections')
+            delta_document = {'term': term, 'last_updated': update, 'previous_update': previous.get('last_updated'), **delta}
+            delta_name = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(now)) + '.json'
+            body = gzip.compress(json.dumps(delta_document).encode('utf-8'), mtime=0)
+            upload_to_digital_ocean_space(body, delta_name, 'application/json', 'gzip', key_prefix=delta_prefix)
+
+    failed = wait_for_uploads()
+    if failed:
+        print(f"{failed} uploads failed, keeping the previous snapshot so the next run publishes again")
+        return sections_df, meetings_df
+    save_snapshot({'term': term, 'last_updated': update, 'last_full_publish': last_full_publish, 'sections': current_sections})
+    return sections_df, meetings_df
 
 # Main function to fetch, parse, and save the course data
 def fetch_and_parse_php():
@@ -122,7 +250,9 @@ def fetch_and_parse_php():
     parsed_data, term, update = fetch_and_parse_php_file(url)
     
     # Convert parsed data to DataFrame and upload to Digital Ocean Spaces
-    convert_to_dataframe(parsed_data, term, update)
+    sections_df, _ = convert_to_dataframe(parsed_data, term, update)
+    wait_for_uploads()
+    return sections_df, term, update
 
 # To ensure compatibility with the backend runner
 if __name__ == "__main__":
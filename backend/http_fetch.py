@@ -0,0 +1,145 @@
+import codecs
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Directory of the on-disk response cache and the size of the shared connection pool
+HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', 'http_cache')
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 20))
+HTTP_TIMEOUT = 30
+
+_session = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+stats = {'requests': 0, 'not_modified': 0, 'downloaded': 0, 'bytes_downloaded': 0, 'bytes_saved': 0}
+
+# Function to get the process-wide session, whose pooled connections are reused across requests and threads.
+# requests is imported with the first session rather than with the module.
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+def record_stats(**counts):
+    with _stats_lock:
+        for key, value in counts.items():
+            stats[key] += value
+
+def cache_paths(url):
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return os.path.join(HTTP_CACHE_DIR, key + '.body'), os.path.join(HTTP_CACHE_DIR, key + '.json')
+
+# Function to load the validators of a cached response, or None if the URL has no usable cache entry
+def load_cache_entry(url):
+    body_path, meta_path = cache_paths(url)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if os.path.exists(body_path) else None
+
+def conditional_headers(meta):
+    headers = {}
+    if meta:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+    return headers
+
+def response_meta(url, response):
+    return {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'encoding': response.encoding
+    }
+
+# Function to atomically write a cache entry; the body is written before the metadata that makes it visible
+def store_cache_entry(url, meta, chunks):
+    os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+    body_path, meta_path = cache_paths(url)
+    fd, tmp_path = tempfile.mkstemp(dir=HTTP_CACHE_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        os.replace(tmp_path, body_path)
+        fd, tmp_meta_path = tempfile.mkstemp(dir=HTTP_CACHE_DIR)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta_path, meta_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def read_cached_body(url, chunk_size):
+    body_path, _ = cache_paths(url)
+    with open(body_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+# Generator yielding the body of a URL in chunks. The request is revalidated with the cached ETag/Last-Modified
+# and a 304 response is served from the cache; a 200 response is cached while it is streamed.
+def iter_fetch(url, chunk_size=64 * 1024, decode_unicode=False):
+    meta = load_cache_entry(url)
+    response = get_session().get(url, headers=conditional_headers(meta), stream=True, timeout=HTTP_TIMEOUT)
+    with response:
+        record_stats(requests=1)
+        if response.status_code == 304 and meta:
+            logger.debug(f"Not modified: {url}")
+            encoding = meta.get('encoding')
+            body_path, _ = cache_paths(url)
+            record_stats(not_modified=1, bytes_saved=os.path.getsize(body_path))
+            chunks = read_cached_body(url, chunk_size)
+        else:
+            response.raise_for_status()
+            encoding = response.encoding or 'utf-8'
+            chunks = response.iter_content(chunk_size=chunk_size)
+            meta = response_meta(url, response)
+            if meta['etag'] or meta['last_modified']:
+                chunks = store_cache_entry(url, meta, chunks)
+            record_stats(downloaded=1)
+
+        decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace') if decode_unicode else None
+        for chunk in chunks:
+            if response.status_code != 304:
+                record_stats(bytes_downloaded=len(chunk))
+            if decoder:
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+            else:
+                yield chunk
+        if decoder:
+            text = decoder.decode(b'', final=True)
+            if text:
+                yield text
+
+# Function to fetch the full body of a URL through the conditional-GET cache
+def fetch(url):
+    return b''.join(iter_fetch(url))
+
+# Function to summarize how many downloads the cache avoided
+def log_stats():
+    with _stats_lock:
+        logger.info(f"HTTP fetch stats: {stats['requests']} requests, {stats['not_modified']} not modified, "
+                    f"{stats['downloaded']} downloaded ({stats['bytes_downloaded']} bytes), {stats['bytes_saved']} bytes saved")
@@ -2,49 +2,37 @@ import logging
 import cProfile
 import pstats
 import os
-import requests
-import hashlib
-import pickle
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-import pandas as pd
+from urllib.parse import urljoin, urlparse
 import re
-import boto3
-from botocore.exceptions import NoCredentialsError
-from threading import Lock
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dotenv import load_dotenv
-
-# Load environment variables    
-load_dotenv(dotenv_path='../.env', override=True)
-
-# Get Digital Ocean credentials from environment variables
-DO_SPACES_KEY = os.getenv('DO_SPACES_KEY')
-DO_SPACES_SECRET = os.getenv('DO_SPACES_SECRET')
-DO_SPACES_REGION = os.getenv('DO_SPACES_REGION', 'nyc3')
-DO_SPACES_BUCKET = os.getenv('DO_SPACES_BUCKET')
-
-# Configure the boto3 client
-session = boto3.session.Session()
-client = session.client('s3',
-                        region_name=DO_SPACES_REGION,
-                        endpoint_url='https://nyc3.digitaloceanspaces.com',
-                        aws_access_key_id=DO_SPACES_KEY,
-                        aws_secret_access_key=DO_SPACES_SECRET)
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from environment import configure_logging, load_environment
+
+# Run standalone, ../.env is loaded before the CRAWL_* and HTTP_* settings are read at import
+if __name__ == "__main__":
+    load_environment()
+
+from dataset_formats import publish_dataset
+import http_fetch
+from crawl_frontier import CrawlFrontier, CRAWL_MAX_DEPTH
+from parse_cache import ParseCache
+from spaces_upload import spaces_bucket, submit_upload, wait_for_uploads
+from concurrency_control import log_limiter_stats
 
 prefix = 'course_data/'
 
-# Directory to save HTML files
-save_dir = "downloaded_html_files"
-os.makedirs(save_dir, exist_ok=True)
+# Concurrency limits and queue size of the crawler
+CRAWL_GLOBAL_CONCURRENCY = int(os.getenv('CRAWL_GLOBAL_CONCURRENCY', 16))
+CRAWL_PER_HOST_CONCURRENCY = int(os.getenv('CRAWL_PER_HOST_CONCURRENCY', 4))
+CRAWL_PARSE_WORKERS = int(os.getenv('CRAWL_PARSE_WORKERS', 2))
+CRAWL_QUEUE_SIZE = int(os.getenv('CRAWL_QUEUE_SIZE', 64))
 
-all_courses = [] # List to store all courses
-lock = Lock() # Lock to ensure thread safety when writing to the shared all_courses list
+# Directory the HTML object names are built under
+save_dir = "downloaded_html_files"
 
-# Set up logging configuration
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    handlers=[logging.FileHandler('multithreaded_njit_catalog_scraper.log', 'w', 'utf-8')])
+# Log file of a standalone run
+LOG_FILE = 'multithreaded_njit_catalog_scraper.log'
 
 logger = logging.getLogger(__name__)
 
@@ -60,33 +48,46 @@ def profile(func):
         return result
     return wrapper
 
-# Function to upload HTML content to Digital Ocean Spaces
-def upload_html_to_spaces(content, object_name):
-    try:
-        client.put_object(
-            Bucket=DO_SPACES_BUCKET,
-            Key=prefix + object_name,
-            Body=content,
-            ContentType='text/html'
-        )
-        logger.info(f"Successfully uploaded {object_name} to {DO_SPACES_BUCKET}/{prefix}")
-    except NoCredentialsError:
-        logger.info("Credentials not available", exc_info=True)
-    except Exception as e:
-        logger.error(f"Failed to upload {object_name} to {DO_SPACES_BUCKET}/{prefix}", exc_info=True)
+# Function to queue HTML content for upload to Digital Ocean Spaces; HTML is gzip-encoded by the uploader
+def upload_html_to_spaces(content, object_name, content_type='text/html', content_encoding=None):
+    submit_upload(spaces_bucket(), prefix + object_name, content, content_type, content_encoding)
+
+# Patterns compiled once for every page
+PREREQ_PATTERN = re.compile(r'Prerequisites?:\s*(.*?)(?:\.|$)', re.IGNORECASE)
+COREQ_PATTERN = re.compile(r'Corequisites?:\s*(.*?)(?:\.|$)', re.IGNORECASE)
+RESTRICT_PATTERN = re.compile(r'Restrictions?:\s*(.*?)(?:\.|$)', re.IGNORECASE)
+
+# XPath expressions for every page, compiled on first use so that importing the scraper does not load lxml
+XPATH_EXPRESSIONS = {
+    'link': '//a/@href',
+    'courses_container': '//div[@id="coursestextcontainer"]',
+    'course_block': '//div[contains(concat(" ", normalize-space(@class), " "), " courseblock ")]',
+    'course_title': './/p[contains(concat(" ", normalize-space(@class), " "), " courseblocktitle ")]',
+    'course_desc': './/p[contains(concat(" ", normalize-space(@class), " "), " courseblockdesc ")]'
+}
+_xpaths = None
+
+def xpaths():
+    global _xpaths
+    if _xpaths is None:
+        from lxml import etree
+        _xpaths = {name: etree.XPath(expression) for name, expression in XPATH_EXPRESSIONS.items()}
+    return _xpaths
 
-# Cache directory
-cache_dir = "cache"
-os.makedirs(cache_dir, exist_ok=True)
+# Version of the parse output; bump it whenever parse_html changes so cached results of older parses are not reused
+PARSER_VERSION = 2
+
+# Parse results keyed by page content, shared by the parse workers
+parse_cache = ParseCache(parser_version=PARSER_VERSION)
 
 # Function to get the HTML content from a URL
 def get_html(url):
+    import requests
     logger.debug(f"Fetching content from {url}")
     try:
-        response = requests.get(url)
-        response.raise_for_status()
+        content = http_fetch.fetch(url)
         logger.info(f"Successfully fetched content from {url}")
-        return response.content
+        return content
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to fetch content from {url}", exc_info=True)
         raise
@@ -103,61 +104,37 @@ def load_html_file(file_path):
         logger.error(f"Failed to load content from {file_path}", exc_info=True)
         raise
 
-# Function to hash content
-def hash_content(content):
-    logger.debug("Hashing content")
-    return hashlib.md5(content.encode()).hexdigest()
-
-# Function to cache results
-def cache_results(file_path, results):
-    logger.debug(f"Caching results to {file_path}")
-    try:
-        with open(file_path, 'wb') as f:
-            pickle.dump(results, f)
-        logger.info(f"Successfully cached results to {file_path}")
-    except Exception as e:
-        logger.error(f"Failed to cache results to {file_path}", exc_info=True)
-
-# Function to load cached results
-def load_cached_results(file_path):
-    logger.debug(f"Loading cached results from {file_path}")
-    try:        
-        with open(file_path, 'rb') as f:
-            return pickle.load(f)
-        logger.info(f"Successfully loaded cached results from {file_path}")
-        return results
-    except Exception as e:
-        logger.error(f"Failed to load cached results from {file_path}", exc_info=True)
-        raise
+# Function to get the text of an element the way the catalog is read: each text node stripped, joined without separators
+def element_text(element):
+    return ''.join(text.strip() for text in element.itertext() if text.strip()).replace('\xa0', ' ')
 
 # Function to extract course information manually with improved parsing to handle full sentences for prerequisites, corequisites, and restrictions
 def extract_course_info_with_cleaned_sentences(course_blocks):
     logger.debug("Extracting course information with cleaned sentences")
     courses = []
-    prereq_pattern = re.compile(r'Prerequisites?:\s*(.*?)(?:\.|$)', re.IGNORECASE)
-    coreq_pattern = re.compile(r'Corequisites?:\s*(.*?)(?:\.|$)', re.IGNORECASE)
-    restrict_pattern = re.compile(r'Restrictions?:\s*(.*?)(?:\.|$)', re.IGNORECASE)
+    course_title_xpath = xpaths()['course_title']
+    course_desc_xpath = xpaths()['course_desc']
 
+    # Course blocks are walked in the already parsed document
     for block in course_blocks:
-        soup = BeautifulSoup(str(block), 'html.parser')
-        title_tag = soup.find('p', class_='courseblocktitle')
-        desc_tag = soup.find('p', class_='courseblockdesc')
-        if title_tag and desc_tag:
-            title_text = title_tag.get_text(strip=True).replace('\xa0', ' ')
-            description = desc_tag.get_text(strip=True).replace('\xa0', ' ')
+        title_tags = course_title_xpath(block)
+        desc_tags = course_desc_xpath(block)
+        if title_tags and desc_tags:
+            title_text = element_text(title_tags[0])
+            description = element_text(desc_tags[0])
             course_id = title_text.split('.')[0]
             title = '.'.join(title_text.split('.')[1:]).strip()
 
             # Extract prerequisites
-            prereq_match = prereq_pattern.search(description)
+            prereq_match = PREREQ_PATTERN.search(description)
             prerequisites = prereq_match.group(1).strip() if prereq_match else "None"
 
             # Extract corequisites
-            coreq_match = coreq_pattern.search(description)
+            coreq_match = COREQ_PATTERN.search(description)
             corequisites = coreq_match.group(1).strip() if coreq_match else "None"
 
             # Extract restrictions
-            restrict_match = restrict_pattern.search(description)
+            restrict_match = RESTRICT_PATTERN.search(description)
             restrictions = restrict_match.group(1).strip() if restrict_match else "None"
 
             # Remove extracted prerequisites, corequisites, and restrictions from description
@@ -179,24 +156,33 @@ def extract_course_info_with_cleaned_sentences(course_blocks):
     logger.info("Successfully extracted course information with cleaned sentences")
     return courses
 
-# Function to process HTML with caching
-def process_html_with_cache(html_content):
-    logger.debug("Processing HTML with caching")
-    cache_file = os.path.join(cache_dir, f"cache_{hash_content(html_content)}.pkl")
-    if os.path.exists(cache_file):
-        logger.info(f"Loading cached results from {cache_file}")
-        return load_cached_results(cache_file)
-    else:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        course_blocks = soup.find_all('div', class_='courseblock')
+# Function to parse a page once, returning its link targets and its courses (None if it has no course content)
+def parse_html(html_content):
+    from lxml import etree, html as lxml_html
+    try:
+        document = lxml_html.fromstring(html_content)
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration
+        document = lxml_html.fromstring(html_content.encode('utf-8'))
+    except etree.ParserError:
+        logger.error("Empty HTML content")
+        return {'links': [], 'courses': None}
+
+    links = xpaths()['link'](document)
+    courses = None
+    if xpaths()['courses_container'](document):
+        course_blocks = xpaths()['course_block'](document)
         if course_blocks:
             logger.info(f"Extracting course information from {len(course_blocks)} course blocks")
-            courses = extract_course_info_with_cleaned_sentences(course_blocks)
-            cache_results(cache_file, courses)
-            return courses
         else:
             logger.error("No course blocks found in HTML content")
-            return []
+        courses = extract_course_info_with_cleaned_sentences(course_blocks)
+    return {'links': links, 'courses': courses}
+
+# Function to process HTML with caching
+def process_html_with_cache(html_content):
+    logger.debug("Processing HTML with caching")
+    return parse_cache.get_or_parse(html_content, parse_html)
 
 # Function to scrape and save HTML from a URL to Digital Ocean Spaces
 def scrape_and_save_html(url, filename):
@@ -208,49 +194,107 @@ def scrape_and_save_html(url, filename):
     except Exception as e:
         logger.error(f"Failed to scrape and save HTML from {url} to {filename} on Digital Ocean Spaces", exc_info=True)
 
-def scrape_link(url):
-    filename = os.path.join(save_dir, url.replace('https://', '').replace('/', '_') + '.html')
-    try:
-        logger.debug(f"Scraping main page: {url}")
-        main_html_content = get_html(url).decode('utf-8')
-        upload_html_to_spaces(main_html_content, filename)
-        logger.info(f"Saved main page: {filename}")
-        
-        soup = BeautifulSoup(main_html_content, 'html.parser')
-        sub_links = soup.select('a[href]')
-        base_url = url
-        
-        # Process and cache course information if available
-        if soup.find('div', id='coursestextcontainer'):
-            processed_courses = process_html_with_cache(main_html_content)
-            with lock: # Ensure only one thread is writing to the shared all_courses list at a time
-                all_courses.extend(processed_courses)
-        else:
-            logger.warning(f"No course content found on {url}")
-        
-        # Scrape sub-links
-        for link in sub_links:
-            sub_url = link.get('href')
-            full_url = urljoin(base_url, sub_url)
-            if full_url.startswith('http'):
-                sub_filename = os.path.join(save_dir, full_url.replace('https://', '').replace('/', '_') + '.html')
-                try:
-                    logger.debug(f"Scraping sub-page: {full_url}")
-                    sub_html_content = get_html(full_url).decode('utf-8')
-                    upload_html_to_spaces(sub_html_content, sub_filename)
-                    logger.info(f"Saved sub-page: {sub_filename}")
-                    
-                    sub_soup = BeautifulSoup(sub_html_content, 'html.parser')
-                    if sub_soup.find('div', id='coursestextcontainer'):
-                        processed_sub_courses = process_html_with_cache(sub_html_content)
-                        with lock:
-                            all_courses.extend(processed_sub_courses)
-
-                except Exception as e:
-                    logger.error(f"Failed to scrape sub-link {full_url}: {e}")
-    
-    except Exception as e:
-        logger.error(f"Failed to scrape main page {url}: {e}")
+# Function to build the object name of a page's HTML in Digital Ocean Spaces
+def html_object_name(url):
+    return os.path.join(save_dir, url.replace('https://', '').replace('/', '_') + '.html')
+
+# Function to parse a page, returning the absolute URLs it links to and the courses it lists
+def parse_page(html_content, url):
+    results = process_html_with_cache(html_content)
+    links = [urljoin(url, href) for href in results['links']]
+    if results['courses'] is None:
+        logger.warning(f"No course content found on {url}")
+        return links, []
+    return links, results['courses']
+
+# Crawl engine: fetch and parse stages connected by a bounded queue, so slow parsing holds back fetching instead
+# of buffering pages. Fetches share a global limit and a per-host limit. Pages are handed to the shared Spaces
+# uploader, whose own workers and queue keep fetching from waiting on uploads.
+class CatalogCrawler:
+    def __init__(self, max_depth=CRAWL_MAX_DEPTH, global_concurrency=CRAWL_GLOBAL_CONCURRENCY,
+                 per_host_concurrency=CRAWL_PER_HOST_CONCURRENCY, parse_workers=CRAWL_PARSE_WORKERS,
+                 queue_size=CRAWL_QUEUE_SIZE):
+        self.max_depth = max_depth
+        self.global_concurrency = global_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+        self.courses = []
+
+    async def enqueue(self, url, depth):
+        # The frontier drops URLs already seen from any seed and those outside the crawl's allow-lists and budgets
+        fetch_url = self.frontier.add(url, depth)
+        if fetch_url is None:
+            return
+        self.pending += 1
+        await self.fetch_queue.put((fetch_url, depth))
+
+    def finish_page(self):
+        self.pending -= 1
+        if self.pending == 0:
+            self.done.set()
+
+    async def fetch_worker(self):
+        while True:
+            url, depth = await self.fetch_queue.get()
+            try:
+                host_limit = self.host_limits.setdefault(urlparse(url).netloc, asyncio.Semaphore(self.per_host_concurrency))
+                async with self.global_limit, host_limit:
+                    logger.debug(f"Scraping page: {url} (depth {depth})")
+                    content = await asyncio.to_thread(get_html, url)
+                await asyncio.to_thread(upload_html_to_spaces, content, html_object_name(url))
+                await self.parse_queue.put((url, depth, content.decode('utf-8')))
+            except Exception as e:
+                # A page that is not parsed is finished here, or the crawl would wait for it forever
+                logger.error(f"Failed to scrape {url}: {e}")
+                self.finish_page()
+            finally:
+                self.fetch_queue.task_done()
+
+    async def parse_worker(self):
+        while True:
+            url, depth, html_content = await self.parse_queue.get()
+            try:
+                links, courses = await asyncio.to_thread(parse_page, html_content, url)
+                self.courses.extend(courses)
+                if self.frontier.can_follow(depth):
+                    for link in links:
+                        await self.enqueue(link, depth + 1)
+            except Exception as e:
+                logger.error(f"Failed to parse {url}: {e}")
+            finally:
+                self.parse_queue.task_done()
+                self.finish_page()
+
+    async def crawl(self, seed_urls):
+        # Queues and primitives are created here so they belong to the running event loop
+        self.fetch_queue = asyncio.Queue() # Holds the crawl frontier; sub-links are added while parsing
+        self.parse_queue = asyncio.Queue(maxsize=self.queue_size)
+        self.global_limit = asyncio.Semaphore(self.global_concurrency)
+        self.host_limits = {}
+        self.frontier = CrawlFrontier(seed_urls, max_depth=self.max_depth)
+        self.pending = 0 # Pages queued but not yet fully parsed
+        self.done = asyncio.Event()
+
+        # asyncio.to_thread runs on the loop's default executor, which has only cpu_count + 4 threads. The
+        # crawl installs its own, with a thread for every fetch worker and every parse worker.
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.global_concurrency + self.parse_workers,
+                                                     thread_name_prefix='crawl'))
+        workers = [asyncio.create_task(self.fetch_worker()) for _ in range(self.global_concurrency)]
+        workers += [asyncio.create_task(self.parse_worker()) for _ in range(self.parse_workers)]
+        try:
+            for url in seed_urls:
+                await self.enqueue(url, 0)
+            if self.pending:
+                await self.done.wait()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await loop.shutdown_default_executor()
+        self.frontier.log_stats()
+        return self.courses
 
 # Main function to scrape courses
 def njit_catalog_scraper():
@@ -261,20 +305,28 @@ def njit_catalog_scraper():
             urls = [line.strip() for line in file.readlines()]
         logger.info(f"Read {len(urls)} URLs to scrape")
 
-        # Scrape main pages and their sub-links with multithreading
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = [executor.submit(scrape_link, url) for url in urls]
-            for future in as_completed(futures):
-                future.result()      
-        
-        # Save all courses to a single JSON file
-        logger.debug("Saving all courses to JSON file")
+        # Scrape main pages and their sub-links with the asynchronous crawler
+        start_time = time.perf_counter()
+        all_courses = asyncio.run(CatalogCrawler().crawl(urls))
+        logger.info(f"Crawled {len(urls)} seed pages in {time.perf_counter() - start_time:.2f}s")
+
+        # Save all courses to a single dataset
+        logger.debug("Saving all courses to dataset files")
+        import pandas as pd
         df_courses = pd.DataFrame(all_courses)
-        upload_html_to_spaces(df_courses.to_json(), "all_courses.json")
+        publish_dataset(df_courses, "all_courses", upload_html_to_spaces, records_key='courses')
+        wait_for_uploads()
         logger.info("Successfully saved all courses to DigitalOcean Space")
-    except Exception as e:
+        http_fetch.log_stats()
+        parse_cache.log_stats()
+        log_limiter_stats()
+    except Exception:
         logger.error("An error occurred during the course scraping process", exc_info=True)
+        raise # So that the backend runner counts the stage as failed and skips the stages depending on it
+    finally:
+        parse_cache.close()
 
 # To ensure compatibility with the backend runner
 if __name__ == "__main__":
+    configure_logging(LOG_FILE, logging.DEBUG)
     njit_catalog_scraper()
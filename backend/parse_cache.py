@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Location and bounds of the parse cache; entries unused for longer than the maximum age are evicted first,
+# then the least recently used ones until the stored results fit the maximum size
+PARSE_CACHE_PATH = os.getenv('PARSE_CACHE_PATH', os.path.join('cache', 'parse_cache.sqlite3'))
+PARSE_CACHE_MAX_BYTES = int(os.getenv('PARSE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+PARSE_CACHE_MAX_AGE = int(os.getenv('PARSE_CACHE_MAX_AGE', 30 * 24 * 60 * 60))
+PARSE_CACHE_BATCH_SIZE = int(os.getenv('PARSE_CACHE_BATCH_SIZE', 100))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS parse_results (
+    content_hash TEXT NOT NULL,
+    parser_version TEXT NOT NULL,
+    result TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (content_hash, parser_version)
+);
+CREATE INDEX IF NOT EXISTS parse_results_last_used ON parse_results (last_used);
+'''
+
+# Function to hash page content; results are addressed by what was parsed, not by where it came from
+def hash_content(content):
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+class ParseCache:
+    """
+    SQLite cache of JSON-serializable parse results keyed by content hash and parser version.
+
+    Results written by a different parser version are never returned, so bumping the version invalidates
+    every earlier parse. Writes and last-used updates from worker threads are buffered and committed in
+    batches of `batch_size`; `flush` commits what is pending and `close` also runs eviction.
+    """
+
+    def __init__(self, path=PARSE_CACHE_PATH, parser_version='1', max_bytes=PARSE_CACHE_MAX_BYTES,
+                 max_age=PARSE_CACHE_MAX_AGE, batch_size=PARSE_CACHE_BATCH_SIZE):
+        self.path = path
+        self.parser_version = str(parser_version)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evicted': 0}
+        self._connection = None
+        self._pending_writes = {}
+        self._pending_touches = set()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # Opened on first use so that importing or constructing the cache touches no files
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def get(self, content_hash):
+        """
+        Return the cached result for `content_hash` under the current parser version, or None.
+        """
+        with self._lock:
+            if content_hash in self._pending_writes:
+                self.stats['hits'] += 1
+                return json.loads(self._pending_writes[content_hash])
+            row = self._connect().execute(
+                'SELECT result FROM parse_results WHERE content_hash = ? AND parser_version = ?',
+                (content_hash, self.parser_version)
+            ).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            self._pending_touches.add(content_hash)
+            self._flush_if_full()
+        return json.loads(row[0])
+
+    def put(self, content_hash, result):
+        """
+        Buffer `result` for `content_hash`; it is committed with the next batch.
+        """
+        serialized = json.dumps(result)
+        with self._lock:
+            self._pending_writes[content_hash] = serialized
+            self._flush_if_full()
+
+    def get_or_parse(self, content, parse):
+        """
+        Return the cached result for `content`, calling `parse(content)` only on a miss.
+        """
+        content_hash = hash_content(content)
+        result = self.get(content_hash)
+        if result is None:
+            result = parse(content)
+            self.put(content_hash, result)
+        return result
+
+    def _flush_if_full(self):
+        if len(self._pending_writes) + len(self._pending_touches) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending_writes and not self._pending_touches:
+            return
+        now = time.time()
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO parse_results (content_hash, parser_version, result, size, created_at, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(content_hash, self.parser_version, result, len(result), now, now)
+                 for content_hash, result in self._pending_writes.items()]
+            )
+            connection.executemany(
+                'UPDATE parse_results SET last_used = ? WHERE content_hash = ? AND parser_version = ?',
+                [(now, content_hash, self.parser_version) for content_hash in self._pending_touches]
+            )
+        self.stats['writes'] += len(self._pending_writes)
+        self._pending_writes.clear()
+        self._pending_touches.clear()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def evict(self):
+        """
+        Remove results of other parser versions, results unused for `max_age` seconds, and then the least
+        recently used results until the cache fits in `max_bytes`. Returns the number of removed results.
+        """
+        with self._lock:
+            self._flush()
+            connection = self._connect()
+            with connection:
+                removed = connection.execute(
+                    'DELETE FROM parse_results WHERE parser_version != ? OR last_used < ?',
+                    (self.parser_version, time.time() - self.max_age)
+                ).rowcount
+                total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM parse_results').fetchone()[0]
+                if total_size > self.max_bytes:
+                    excess = total_size - self.max_bytes
+                    rows = connection.execute('SELECT content_hash, size FROM parse_results ORDER BY last_used').fetchall()
+                    evicted = []
+                    for content_hash, size in rows:
+                        if excess <= 0:
+                            break
+                        evicted.append((content_hash,))
+                        excess -= size
+                    connection.executemany('DELETE FROM parse_results WHERE content_hash = ?', evicted)
+                    removed += len(evicted)
+            self.stats['evicted'] += removed
+        if removed:
+            logger.info(f"Evicted {removed} parse cache entries from {self.path}")
+        return removed
+
+    def close(self):
+        if self._connection is None and not self._pending_writes:
+            return
+        self.evict()
+        with self._lock:
+            self._connection.close()
+            self._connection = None
+
+    def log_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / lookups * 100 if lookups else 0
+        logger.info(f"Parse cache stats: {stats['hits']} hits, {stats['misses']} misses ({hit_rate:.1f}% hit rate), "
+                    f"{stats['writes']} writes, {stats['evicted']} evicted")
@@ -0,0 +1,348 @@
+import contextvars
+import gzip
+import hashlib
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from concurrency_control import SPACES_MAX_CONCURRENCY, get_limiter, throttle_info
+from environment import load_environment
+
+logger = logging.getLogger(__name__)
+
+# Upload workers, queued uploads before submitters are held back, and retries of a failed upload. The workers
+# only bound the uploads; the shared "spaces" limiter decides how many run at once.
+SPACES_UPLOAD_WORKERS = int(os.getenv('SPACES_UPLOAD_WORKERS', SPACES_MAX_CONCURRENCY))
+SPACES_UPLOAD_QUEUE_SIZE = int(os.getenv('SPACES_UPLOAD_QUEUE_SIZE', 256))
+SPACES_UPLOAD_RETRIES = int(os.getenv('SPACES_UPLOAD_RETRIES', 4))
+SPACES_RETRY_BASE_DELAY = 0.5
+SPACES_RETRY_MAX_DELAY = 20
+
+# Bodies of these types are gzip-encoded on upload unless they are smaller than SPACES_GZIP_MIN_BYTES
+GZIP_CONTENT_TYPES = ('text/html', 'text/plain', 'application/json')
+SPACES_GZIP_MIN_BYTES = int(os.getenv('SPACES_GZIP_MIN_BYTES', 1024))
+
+# Whether uploads whose bytes match the object already stored under the key are skipped
+SPACES_SKIP_UNCHANGED = os.getenv('SPACES_SKIP_UNCHANGED', '1') == '1'
+
+# Stored bytes of the uploaded objects kept in memory for later stages after `retain_published`
+SPACES_RETAIN_MAX_BYTES = int(os.getenv('SPACES_RETAIN_MAX_BYTES', 64 * 1024 * 1024))
+
+# Error codes worth retrying; other client errors (e.g. AccessDenied, NoSuchBucket) fail immediately
+RETRYABLE_ERROR_CODES = {'SlowDown', 'RequestTimeout', 'RequestTimeTooSkewed', 'InternalError', 'ServiceUnavailable',
+                         'Throttling', 'ThrottlingException', 'TooManyRequests', '500', '502', '503', '504'}
+
+_client = None
+_client_lock = threading.Lock()
+_uploader = None
+_uploader_lock = threading.Lock()
+_upload_group = contextvars.ContextVar('upload_group', default=None)
+
+# Function to get the Digital Ocean Spaces bucket that every backend module reads and writes
+def spaces_bucket():
+    load_environment()
+    return os.getenv('DO_SPACES_BUCKET')
+
+# Function to get the process-wide S3 client for Digital Ocean Spaces, shared by every backend module. Its
+# connection pool is sized for the upload workers plus the downloads running next to them. boto3 is imported
+# with the first client rather than with the module. botocore's own retries are off: calls go through
+# call_spaces, whose limiter retries throttling and which retries other transient errors itself.
+def get_s3_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            import boto3
+            from botocore.config import Config
+            load_environment()
+            session = boto3.session.Session()
+            _client = session.client('s3',
+                                     region_name=os.getenv('DO_SPACES_REGION', 'nyc3'),
+                                     endpoint_url=os.getenv('DO_SPACES_ENDPOINT', 'https://nyc3.digitaloceanspaces.com'),
+                                     aws_access_key_id=os.getenv('DO_SPACES_KEY'),
+                                     aws_secret_access_key=os.getenv('DO_SPACES_SECRET'),
+                                     config=Config(max_pool_connections=SPACES_UPLOAD_WORKERS * 2,
+                                                   tcp_keepalive=True,
+                                                   retries={'mode': 'standard', 'max_attempts': 1}))
+        return _client
+
+# Function to gzip-encode a body when its content type compresses well and it has no encoding yet
+def encode_body(body, content_type, content_encoding=None, compress=True):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if (compress and content_encoding is None and content_type.split(';')[0] in GZIP_CONTENT_TYPES
+            and len(body) >= SPACES_GZIP_MIN_BYTES):
+        return gzip.compress(body, mtime=0), 'gzip'
+    return body, content_encoding
+
+# Function to tell whether an error is transient. Throttling is not: the limiter has already retried it.
+def is_retryable(error):
+    from botocore.exceptions import ClientError, NoCredentialsError
+    if isinstance(error, NoCredentialsError) or throttle_info(error)[0]:
+        return False
+    if isinstance(error, ClientError):
+        code = str(error.response.get('Error', {}).get('Code'))
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return code in RETRYABLE_ERROR_CODES or status == 429 or status >= 500
+    return True # Connection resets and timeouts
+
+# Function to call an S3 client method within the shared "spaces" limit, retrying transient errors with
+# exponential backoff and full jitter; throttling is retried by the limiter, which also lowers the limit
+def call_spaces(method, retries=SPACES_UPLOAD_RETRIES, **kwargs):
+    for attempt in range(retries + 1):
+        try:
+            return get_limiter('spaces').call(getattr(get_s3_client(), method), **kwargs)
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            delay = random.uniform(0, min(SPACES_RETRY_MAX_DELAY, SPACES_RETRY_BASE_DELAY * 2 ** attempt))
+            logger.warning(f"{method} of {kwargs.get('Key', kwargs.get('Prefix'))} failed ({e}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+# Function to upload one object through call_spaces
+def put_object(bucket, key, body, content_type, content_encoding=None, metadata=None, retries=SPACES_UPLOAD_RETRIES):
+    extra_args = {}
+    if content_encoding:
+        extra_args['ContentEncoding'] = content_encoding
+    if metadata:
+        extra_args['Metadata'] = metadata
+    return call_spaces('put_object', retries=retries, Bucket=bucket, Key=key, Body=body, ContentType=content_type, **extra_args)
+
+# Generator yielding the list_objects_v2 pages of a prefix, following continuation tokens past 1000 keys
+def iter_object_pages(bucket, prefix):
+    kwargs = {'Bucket': bucket, 'Prefix': prefix}
+    while True:
+        page = call_spaces('list_objects_v2', **kwargs)
+        yield page
+        if not page.get('IsTruncated'):
+            break
+        kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+# Function to list the ETag of every object under a prefix. Returns the ETags keyed by object key and the
+# number of list requests made.
+def list_object_etags(bucket, prefix):
+    etags = {}
+    requests = 0
+    for page in iter_object_pages(bucket, prefix):
+        requests += 1
+        for obj in page.get('Contents', []):
+            etags[obj['Key']] = obj['ETag'].strip('"')
+    return etags, requests
+
+class UploadGroup:
+    """
+    Counter of the uploads queued by one stage, so the stage can wait for its own uploads while other
+    stages keep submitting to the shared queue, and tell whether any of them failed.
+    """
+
+    def __init__(self):
+        self.pending = 0
+        self.failed = 0
+        self._condition = threading.Condition()
+
+    def add(self):
+        with self._condition:
+            self.pending += 1
+
+    def done(self, failed=False):
+        with self._condition:
+            self.pending -= 1
+            self.failed += failed
+            self._condition.notify_all()
+
+    def wait(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self.pending == 0)
+
+# Function to start an upload group for the current context; uploads submitted from it, including from tasks
+# and threads started with a copy of the context (asyncio.to_thread), are waited for by wait_for_uploads
+def start_upload_group():
+    group = UploadGroup()
+    _upload_group.set(group)
+    return group
+
+class SpacesUploader:
+    """
+    Background upload queue for Digital Ocean Spaces.
+
+    `submit` encodes the body and returns as soon as the upload is queued; it only blocks while `queue_size`
+    uploads are already waiting. A pool of `workers` threads uploads through the shared client. `wait`
+    blocks until every queued upload has finished and returns the upload stats.
+
+    With `skip_unchanged`, the first upload under a top-level prefix (e.g. "course_data/") lists the ETags
+    of that prefix once, and later uploads whose MD5 matches the stored ETag are skipped. Uploaded objects
+    carry the SHA-256 of their content as "sha256" metadata.
+
+    After `retain_published(prefix, extensions, max_bytes)`, the stored body, Content-Encoding and ETag of
+    each object uploaded under the prefix with one of the extensions are kept in memory and returned by
+    `published_objects`, so later stages can use them without downloading them again. Objects skipped as
+    unchanged are not kept, and once `max_bytes` are held further objects are left to be downloaded.
+    """
+
+    def __init__(self, workers=SPACES_UPLOAD_WORKERS, queue_size=SPACES_UPLOAD_QUEUE_SIZE, skip_unchanged=SPACES_SKIP_UNCHANGED):
+        self.workers = workers
+        self.skip_unchanged = skip_unchanged
+        self.stats = {'uploaded': 0, 'failed': 0, 'bytes_uploaded': 0, 'bytes_before_encoding': 0,
+                      'skipped': 0, 'bytes_saved': 0, 'list_requests': 0}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stats_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._threads = []
+        self._etags = {} # (bucket, key) -> ETag of the stored object
+        self._indexed_prefixes = set()
+        self._published_prefix = None
+        self._published_extensions = None
+        self._published_max_bytes = 0
+        self._published_bytes = 0
+        self._published = {} # key -> (ETag, stored body, Content-Encoding)
+
+    def _is_unchanged(self, bucket, key, md5):
+        index_prefix = key.split('/', 1)[0] + '/' if '/' in key else ''
+        with self._index_lock:
+            if (bucket, index_prefix) not in self._indexed_prefixes:
+                try:
+                    etags, requests = list_object_etags(bucket, index_prefix)
+                except Exception as e:
+                    logger.warning(f"Could not index {bucket}/{index_prefix}, uploading without skip checks: {e}")
+                    etags, requests = {}, 0
+                self._etags.update(((bucket, object_key), etag) for object_key, etag in etags.items())
+                self._indexed_prefixes.add((bucket, index_prefix))
+                self._record(list_requests=requests)
+                logger.info(f"Indexed {len(etags)} existing objects under {bucket}/{index_prefix}")
+            return self._etags.get((bucket, key)) == md5
+
+    def _remember(self, bucket, key, md5):
+        with self._index_lock:
+            if md5 is None:
+                self._etags.pop((bucket, key), None)
+                self._forget_published(key)
+            else:
+                self._etags[(bucket, key)] = md5
+
+    def retain_published(self, prefix, extensions=None, max_bytes=SPACES_RETAIN_MAX_BYTES):
+        with self._index_lock:
+            self._published_prefix = prefix
+            self._published_extensions = tuple(extensions) if extensions else None
+            self._published_max_bytes = max_bytes
+
+    def published_objects(self):
+        with self._index_lock:
+            return dict(self._published)
+
+    def _forget_published(self, key):
+        # Called with the index lock held
+        entry = self._published.pop(key, None)
+        if entry is not None:
+            self._published_bytes -= len(entry[1])
+
+    def _publish(self, key, md5, body, content_encoding=None):
+        with self._index_lock:
+            if self._published_prefix is None or not key.startswith(self._published_prefix):
+                return
+            if self._published_extensions and not key.endswith(self._published_extensions):
+                return
+            self._forget_published(key)
+            if self._published_bytes + len(body) > self._published_max_bytes:
+                logger.debug(f"Not keeping {key} in memory, {self._published_bytes} bytes already kept")
+                return
+            # Kept encoded as stored, like a downloaded body, so it takes no more memory than its listed size
+            self._published[key] = (md5, body, content_encoding)
+            self._published_bytes += len(body)
+
+    def _start(self):
+        # Workers are started on the first submit so that creating the uploader starts no threads
+        if not self._threads:
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'spaces-upload-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _record(self, **counts):
+        with self._stats_lock:
+            for key, value in counts.items():
+                self.stats[key] += value
+
+    def _worker(self):
+        from botocore.exceptions import NoCredentialsError
+        while True:
+            bucket, key, body, content_type, content_encoding, metadata, original_size, md5, group = self._queue.get()
+            failed = True
+            try:
+                put_object(bucket, key, body, content_type, content_encoding, metadata)
+                self._record(uploaded=1, bytes_uploaded=len(body), bytes_before_encoding=original_size)
+                self._publish(key, md5, body, content_encoding)
+                failed = False
+                logger.info(f"Successfully uploaded {key} to {bucket}")
+            except NoCredentialsError:
+                self._remember(bucket, key, None)
+                self._record(failed=1)
+                logger.error("Credentials not available")
+            except Exception:
+                self._remember(bucket, key, None)
+                self._record(failed=1)
+                logger.error(f"Failed to upload {key} to {bucket}", exc_info=True)
+            finally:
+                if group is not None:
+                    group.done(failed)
+                self._queue.task_done()
+
+    def submit(self, bucket, key, body, content_type, content_encoding=None, metadata=None, compress=True):
+        content = body.encode('utf-8') if isinstance(body, str) else body
+        body, content_encoding = encode_body(content, content_type, content_encoding, compress)
+        # The ETag of a single-part upload is the MD5 of the stored bytes
+        md5 = hashlib.md5(body).hexdigest()
+        if self.skip_unchanged and self._is_unchanged(bucket, key, md5):
+            self._record(skipped=1, bytes_saved=len(body))
+            logger.debug(f"Skipping unchanged {key}")
+            return
+        # Recorded when queued, so a later submit of the same bytes is skipped even before this upload finishes
+        self._remember(bucket, key, md5)
+        metadata = {**(metadata or {}), 'sha256': hashlib.sha256(content).hexdigest()}
+        with self._start_lock:
+            self._start()
+        group = _upload_group.get()
+        if group is not None:
+            group.add()
+        self._queue.put((bucket, key, body, content_type, content_encoding, metadata, len(content), md5, group))
+
+    def snapshot_stats(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def wait(self):
+        self._queue.join()
+        return self.snapshot_stats()
+
+    def log_stats(self):
+        stats = self.snapshot_stats()
+        logger.info(f"Spaces upload stats: {stats['uploaded']} uploaded, {stats['failed']} failed, "
+                    f"{stats['bytes_uploaded']} bytes sent for {stats['bytes_before_encoding']} bytes of content; "
+                    f"{stats['skipped']} unchanged skipped, saving {stats['bytes_saved']} bytes and "
+                    f"{stats['skipped'] - stats['list_requests']} requests ({stats['list_requests']} list requests made)")
+
+# Function to get the process-wide uploader shared by every backend module
+def get_uploader():
+    global _uploader
+    with _uploader_lock:
+        if _uploader is None:
+            _uploader = SpacesUploader()
+        return _uploader
+
+# Function to queue an upload on the shared uploader
+def submit_upload(bucket, key, body, content_type, content_encoding=None, metadata=None, compress=True):
+    get_uploader().submit(bucket, key, body, content_type, content_encoding, metadata, compress)
+
+# Function to wait for the uploads of the current upload group, or for every queued upload outside a group,
+# and log the upload stats. Returns the number of failed uploads of the group, or of the uploader outside a group.
+def wait_for_uploads():
+    uploader = get_uploader()
+    group = _upload_group.get()
+    if group is not None:
+        group.wait()
+        failed = group.failed
+    else:
+        failed = uploader.wait()['failed']
+    uploader.log_stats()
+    return failed
@@ -0,0 +1,115 @@
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrency_control import call_openai, iter_openai_items
+
+logger = logging.getLogger(__name__)
+
+# Files attached per file batch, batches indexed at once, and how often files that failed indexing are retried
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 100))
+INGEST_CONCURRENT_BATCHES = int(os.getenv('INGEST_CONCURRENT_BATCHES', 4))
+INGEST_MAX_ATTEMPTS = int(os.getenv('INGEST_MAX_ATTEMPTS', 3))
+
+# Polling of a batch: the interval starts at the initial delay and doubles up to the maximum
+INGEST_POLL_INITIAL_DELAY = 1
+INGEST_POLL_MAX_DELAY = 30
+INGEST_TIMEOUT = int(os.getenv('INGEST_TIMEOUT', 60 * 60))
+
+TERMINAL_BATCH_STATUSES = {'completed', 'failed', 'cancelled'}
+
+# Function to poll a file batch until it reaches a terminal status, returning the final batch
+def wait_for_batch(client, vector_store_id, batch_id, timeout=INGEST_TIMEOUT):
+    delay = INGEST_POLL_INITIAL_DELAY
+    deadline = time.monotonic() + timeout
+    while True:
+        batch = call_openai(client.beta.vector_stores.file_batches.retrieve, batch_id, vector_store_id=vector_store_id)
+        if batch.status in TERMINAL_BATCH_STATUSES:
+            return batch
+        if time.monotonic() >= deadline:
+            logger.error(f"File batch {batch_id} still {batch.status} after {timeout}s, cancelling")
+            call_openai(client.beta.vector_stores.file_batches.cancel, batch_id, vector_store_id=vector_store_id)
+            return call_openai(client.beta.vector_stores.file_batches.retrieve, batch_id, vector_store_id=vector_store_id)
+        counts = batch.file_counts
+        logger.info(f"File batch {batch_id}: {counts.completed}/{counts.total} indexed, {counts.failed} failed")
+        time.sleep(random.uniform(delay / 2, delay))
+        delay = min(delay * 2, INGEST_POLL_MAX_DELAY)
+
+# Function to attach one chunk of files as a file batch and record each file's indexing status in the report
+def ingest_chunk(client, vector_store_id, keys, report):
+    file_ids = {report[key]['file_id']: key for key in keys}
+    start_time = time.monotonic()
+    batch = call_openai(client.beta.vector_stores.file_batches.create,
+                        vector_store_id=vector_store_id, file_ids=list(file_ids))
+    batch = wait_for_batch(client, vector_store_id, batch.id)
+    elapsed = time.monotonic() - start_time
+    for key in keys:
+        report[key]['attempts'] += 1
+        report[key]['indexing_seconds'] = elapsed
+        report[key]['status'] = 'failed' # Until the batch lists the file with another status
+    files = iter_openai_items(client.beta.vector_stores.file_batches.list_files, batch.id, vector_store_id=vector_store_id)
+    for file in files:
+        key = file_ids.get(file.id)
+        if key is not None:
+            report[key]['status'] = file.status
+            report[key]['error'] = file.last_error.message if file.last_error else None
+    logger.info(f"File batch {batch.id} {batch.status} in {elapsed:.1f}s: {batch.file_counts.completed} completed, "
+                f"{batch.file_counts.failed} failed of {len(keys)}")
+
+def ingest_files(client, vector_store_id, report, batch_size=INGEST_BATCH_SIZE,
+                 concurrent_batches=INGEST_CONCURRENT_BATCHES, max_attempts=INGEST_MAX_ATTEMPTS):
+    """
+    Attach uploaded files to a vector store and wait until they are indexed.
+
+    `report` maps each Spaces key to its upload result ({"file_id", "status", "upload_seconds", ...}); files
+    with status "uploaded" are attached in batches of `batch_size`, `concurrent_batches` at a time, and each
+    batch is polled until it finishes. Files that failed indexing are detached and retried in new batches,
+    up to `max_attempts` in total. The report is updated in place with each file's final "status",
+    "attempts", "indexing_seconds" and "error", and returned.
+    """
+    for entry in report.values():
+        entry.setdefault('attempts', 0)
+        entry.setdefault('indexing_seconds', None)
+        entry.setdefault('error', None)
+
+    pending = [key for key, entry in report.items() if entry['status'] == 'uploaded']
+    while pending:
+        chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        with ThreadPoolExecutor(max_workers=concurrent_batches) as executor:
+            for future in [executor.submit(ingest_chunk, client, vector_store_id, chunk, report) for chunk in chunks]:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"File batch failed: {e}")
+        for key in pending:
+            if report[key]['status'] == 'uploaded': # The batch itself could not be created
+                report[key]['attempts'] += 1
+                report[key]['status'] = 'failed'
+
+        pending = [key for key in pending
+                   if report[key]['status'] in ('failed', 'cancelled') and report[key]['attempts'] < max_attempts]
+        for key in pending:
+            # A failed file stays attached with its error; it is detached before being added to a new batch
+            try:
+                call_openai(client.beta.vector_stores.files.delete,
+                            vector_store_id=vector_store_id, file_id=report[key]['file_id'])
+            except Exception as e:
+                logger.warning(f"Failed to detach {report[key]['file_id']} before retrying: {e}")
+            report[key]['status'] = 'uploaded'
+        if pending:
+            logger.info(f"Retrying {len(pending)} files that failed indexing")
+    return report
+
+# Function to log a summary of an ingestion report and the files that did not make it into the vector store
+def log_report(report):
+    statuses = {}
+    for entry in report.values():
+        statuses[entry['status']] = statuses.get(entry['status'], 0) + 1
+    upload_seconds = sum(entry.get('upload_seconds') or 0 for entry in report.values())
+    indexing_seconds = max((entry.get('indexing_seconds') or 0 for entry in report.values()), default=0)
+    logger.info(f"Ingestion report: {statuses}; {upload_seconds:.1f}s spent uploading, "
+                f"longest batch indexed in {indexing_seconds:.1f}s")
+    for key, entry in sorted(report.items()):
+        if entry['status'] != 'completed':
+            logger.warning(f"{key}: {entry['status']} after {entry.get('attempts', 0)} attempts ({entry.get('error')})")
@@ -1,31 +1,46 @@
 import streamlit as st
 import time
-from openai import OpenAI
-import boto3
-from botocore.exceptions import NoCredentialsError
-from dotenv import load_dotenv
 import os
+import io
 import json
 import logging
+from collections import deque
 import cProfile
 import pstats
 from html_templates import bot_template, user_template, css
-
-# Load environment variables
-load_dotenv(dotenv_path='../.env', override=True)
-client = OpenAI()
+from utils.resource_cache import resource_cache
+from utils.upload_cache import FileUploadCache
+from utils.transcript_extractor import extract_transcript_profile
 
 # Global variables for vector store and assistant
 assistant_id = None
 vector_store_id = None
 
-# Set up logging configuration
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    handlers=[logging.FileHandler('app.log', 'w', 'utf-8')])
+# Maximum number of messages kept in a session's chat history
+MAX_CHAT_HISTORY = 200
+
+# Seconds before the cached ids are revalidated, and how long a stale copy may be served meanwhile
+IDS_CACHE_TTL = 300
+IDS_CACHE_STALE_TTL = 24 * 60 * 60
+
+# Run statuses after which a run will not progress any further
+TERMINAL_RUN_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete", "requires_action"}
+
+# Run statuses during which a thread accepts no new run
+ACTIVE_RUN_STATUSES = {"queued", "in_progress", "requires_action"}
 
 logger = logging.getLogger(__name__)
 
+# Function to load the environment variables and set up logging, run once per process by main rather than
+# on import
+def configure_process():
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path='../.env', override=True)
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        handlers=[logging.FileHandler('app.log', 'w', 'utf-8')])
+    return True
+
 # Function to profile
 def profile(func):
     def wrapper(*args, **kwargs):
@@ -37,31 +52,43 @@ def profile(func):
         stats.print_stats()
         return result
     return wrapper
-# Get Digital Ocean credentials from environment variables
-DO_SPACES_KEY = os.getenv('DO_SPACES_KEY')
-DO_SPACES_SECRET = os.getenv('DO_SPACES_SECRET')
-DO_SPACES_REGION = os.getenv('DO_SPACES_REGION', 'nyc3')
-DO_SPACES_BUCKET = os.getenv('DO_SPACES_BUCKET')
-
-# Configure the boto3 client
-session = boto3.session.Session()
-s3_client = session.client('s3',
-                        region_name=DO_SPACES_REGION,
-                        endpoint_url='https://nyc3.digitaloceanspaces.com',
-                        aws_access_key_id=DO_SPACES_KEY,
-                        aws_secret_access_key=DO_SPACES_SECRET)
+# Function to create the boto3 client from the Digital Ocean credentials in the environment
+def create_s3_client():
+    import boto3
+    session = boto3.session.Session()
+    return session.client('s3',
+                          region_name=os.getenv('DO_SPACES_REGION', 'nyc3'),
+                          endpoint_url='https://nyc3.digitaloceanspaces.com',
+                          aws_access_key_id=os.getenv('DO_SPACES_KEY'),
+                          aws_secret_access_key=os.getenv('DO_SPACES_SECRET'))
+
+# Function to create the OpenAI client; the SDK is imported with the first client rather than with the app
+def create_openai_client():
+    from openai import OpenAI
+    return OpenAI()
+
+# Clients are built on first use, once per process, and shared across reruns and sessions
+def get_openai_client():
+    return resource_cache.get("openai_client", create_openai_client)
+
+def get_s3_client():
+    return resource_cache.get("s3_client", create_s3_client)
 
 prefix = 'ids/'
 
+def fetch_ids_from_spaces():
+    logger.info("Retrieving Assistant ID and Vector Store ID from Spaces")
+    response = get_s3_client().get_object(Bucket=os.getenv('DO_SPACES_BUCKET'), Key=prefix + 'ids.json')
+    ids = json.loads(response['Body'].read().decode('utf-8'))
+    assistant_id = ids['assistant_id']
+    vector_store_id = ids['vector_store_id']
+    logger.info(f"Retrieved Assistant ID: {assistant_id} and Vector Store ID: {vector_store_id} from Spaces")
+    return assistant_id, vector_store_id
+
 def retrieve_ids_from_spaces():
+    from botocore.exceptions import NoCredentialsError
     try:
-        logger.info("Retrieving Assistant ID and Vector Store ID from Spaces")
-        response = s3_client.get_object(Bucket=DO_SPACES_BUCKET, Key=prefix + 'ids.json')
-        ids = json.loads(response['Body'].read().decode('utf-8'))
-        assistant_id = ids['assistant_id']
-        vector_store_id = ids['vector_store_id']
-        logger.info(f"Retrieved Assistant ID: {assistant_id} and Vector Store ID: {vector_store_id} from Spaces")
-        return assistant_id, vector_store_id
+        return resource_cache.get("ids", fetch_ids_from_spaces, ttl=IDS_CACHE_TTL, stale_ttl=IDS_CACHE_STALE_TTL)
     except NoCredentialsError:
         logger.error("Credentials not available")
         return None, None
@@ -69,67 +96,186 @@ def retrieve_ids_from_spaces():
         logger.error(f"An error occurred: {e}")
         return None, None
 
+# Function to delete an uploaded transcript once its cache entry has expired
+def delete_uploaded_file(file_id):
+    logger.info(f"Deleting expired transcript upload: {file_id}")
+    get_openai_client().files.delete(file_id)
+
+# Function to upload the transcript, reusing an earlier upload of the same bytes
+def upload_transcript(uploaded_file):
+    upload_cache = resource_cache.get("transcript_upload_cache", lambda: FileUploadCache(on_expire=delete_uploaded_file))
+    def upload(content):
+        logger.info(f"Uploading transcript: {uploaded_file.name}")
+        return get_openai_client().files.create(file=(uploaded_file.name, content), purpose="assistants").id
+    return upload_cache.get_or_upload(uploaded_file.getvalue(), upload)
+
 def start_assistant_thread(uploaded_file, prompt):
-    logger.info(f"Starting Assistant Thread with Transcript attached")
-    file = client.files.create(file=uploaded_file, purpose="assistants")
-    updated_prompt = "You have been provided with my transcript. Based on its information, answer the following question: " + prompt
-    tools = [{"type": "file_search"}]
-
-    # Create the message with the content and the file attached using the tools array
-    updated_prompt = "You have been provided with my transcript. Based on its information, answer the following question: " + prompt
-    messages = [{
-        "role": "user",
-        "content": updated_prompt,
-        "attachments": [{"file_id": file.id, "tools": tools}]
-    }] 
+    # Send the transcript as a compact parsed profile, attaching the PDF only if parsing fails
+    try:
+        transcript_profile = extract_transcript_profile(io.BytesIO(uploaded_file.getvalue()))
+    except Exception as e:
+        logger.error(f"Failed to parse transcript locally: {e}")
+        transcript_profile = None
+
+    if transcript_profile:
+        logger.info(f"Starting Assistant Thread with parsed Transcript profile")
+        # The profile goes in its own content part so the chat history only shows the question
+        updated_prompt = "Based on my transcript's information, answer the following question: " + prompt
+        messages = [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "Here is my transcript, parsed into JSON: " + transcript_profile},
+                {"type": "text", "text": updated_prompt}
+            ]
+        }]
+    else:
+        logger.info(f"Starting Assistant Thread with Transcript attached")
+        file_id = upload_transcript(uploaded_file)
+        tools = [{"type": "file_search"}]
+
+        # Create the message with the content and the file attached using the tools array
+        updated_prompt = "You have been provided with my transcript. Based on its information, answer the following question: " + prompt
+        messages = [{
+            "role": "user",
+            "content": updated_prompt,
+            "attachments": [{"file_id": file_id, "tools": tools}]
+        }]
     try:
         logger.info("Creating Assistant Thread")
-        thread = client.beta.threads.create(messages=messages)
+        thread = get_openai_client().beta.threads.create(messages=messages)
         return thread.id
     except Exception as e: 
         logger.error(f"An error occurred: {e}")
         raise e
     
-def retrieve_thread(thread_id):
+def retrieve_thread(thread_id, after=None):
+    """
+    Retrieve the messages of a thread in chronological order, only those newer than `after` if given.
+    """
     try:
-        logger.info(f"Retrieving Thread: {thread_id}")
-        thread_messages = client.beta.threads.messages.list(thread_id)
-        list_messages = thread_messages.data
+        logger.info(f"Retrieving Thread: {thread_id} after message: {after}")
+        params = {"order": "asc"}
+        if after:
+            params["after"] = after
         thread_messages = []
-        for message in list_messages:
-            obj = {}
-            obj["role"] = message.role
-            obj["content"] = message.content[0].text.value
-            thread_messages.append(obj)
-        return thread_messages[::-1]
+        # Iterating the page follows the pagination cursor for threads with more than one page of new messages
+        for message in get_openai_client().beta.threads.messages.list(thread_id, **params):
+            thread_messages.append({
+                "id": message.id,
+                "role": message.role,
+                "status": message.status,
+                "content": message.content[-1].text.value if message.content else None
+            })
+        return thread_messages
     except Exception as e:
         logger.error(f"An error occurred: {e}")
         raise e
 
+# Function to append messages newer than the session's cursor to the bounded chat history
+def update_chat_history(thread_id):
+    if st.session_state.get("history_thread_id") != thread_id:
+        st.session_state.history_thread_id = thread_id
+        st.session_state.chat_history = deque(maxlen=MAX_CHAT_HISTORY)
+        st.session_state.seen_message_ids = set()
+        st.session_state.message_cursor = None
+
+    appended = 0
+    for message in retrieve_thread(thread_id, after=st.session_state.message_cursor):
+        # A message still being written (the run timed out or is still going) stops the cursor, so it and the
+        # messages after it are fetched again, finished, on the next update. Incomplete messages are final.
+        if message["status"] == "in_progress":
+            break
+        st.session_state.message_cursor = message["id"]
+        if message["content"] is None or message["id"] in st.session_state.seen_message_ids:
+            continue
+        if len(st.session_state.chat_history) == st.session_state.chat_history.maxlen:
+            st.session_state.seen_message_ids.discard(st.session_state.chat_history[0]["id"])
+        st.session_state.chat_history.append(message)
+        st.session_state.seen_message_ids.add(message["id"])
+        appended += 1
+    logger.info(f"Appended {appended} new messages to chat history")
+
 def add_message_to_thread(thread_id, message):
     logger.info(f"Adding message to Thread: {thread_id}")
-    client.beta.threads.messages.create(thread_id, role="user", content=message)
+    get_openai_client().beta.threads.messages.create(thread_id, role="user", content=message)
 
 def run_assistant(thread_id, assistant_id):
     try:
         logger.info(f"Running Assistant: {assistant_id}")
-        run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+        run = get_openai_client().beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
         return run.id
     except Exception as e:
         logger.error(f"An error occurred: {e}")
         raise e
 
+# Function to get the id of the thread's latest run if it is still active, or None
+def find_active_run(thread_id):
+    try:
+        runs = get_openai_client().beta.threads.runs.list(thread_id=thread_id, limit=1)
+        if runs.data and runs.data[0].status in ACTIVE_RUN_STATUSES:
+            logger.info(f"Found active Run: {runs.data[0].id}")
+            return runs.data[0].id
+        return None
+    except Exception as e:
+        logger.error(f"An error occurred: {e}")
+        raise e
+
 def check_run_status(thread_id, run_id):
     try:
         logger.info(f"Checking Run Status: {run_id}")
-        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        run = get_openai_client().beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
         return run.status
     except Exception as e:
         logger.error(f"An error occurred: {e}")
         raise e
 
+# Function to poll the status of a run with exponential backoff, used when streaming is unavailable
+def poll_run_status(thread_id, run_id, max_backoff_time=30, max_retries=10):
+    backoff_time = 1  # Start with 1 second delay
+    retries = 0
+    status = check_run_status(thread_id, run_id)
+    while status not in TERMINAL_RUN_STATUSES and retries < max_retries:
+        time.sleep(backoff_time)
+        status = check_run_status(thread_id, run_id)
+        backoff_time = min(backoff_time * 2, max_backoff_time)  # Exponential backoff
+        retries += 1
+    return status
+
+# Function to stream a run, rendering text deltas into the placeholder as they arrive
+def stream_assistant(thread_id, assistant_id, placeholder):
+    logger.info(f"Streaming Assistant: {assistant_id}")
+    run_id = None
+    response_text = ""
+    start_time = time.perf_counter()
+    first_token_time = None
+    try:
+        with get_openai_client().beta.threads.runs.stream(thread_id=thread_id, assistant_id=assistant_id) as stream:
+            for event in stream:
+                if event.event == "thread.run.created":
+                    run_id = event.data.id
+                elif event.event == "thread.message.delta":
+                    for block in event.data.delta.content or []:
+                        if block.type == "text" and block.text and block.text.value:
+                            if first_token_time is None:
+                                first_token_time = time.perf_counter() - start_time
+                                logger.info(f"First token after {first_token_time:.2f}s")
+                            response_text += block.text.value
+                    placeholder.markdown(bot_template.replace("{{MSG}}", f"AI: {response_text}"), unsafe_allow_html=True)
+            run = stream.get_final_run()
+        logger.info(f"Run {run.id} finished with status {run.status} after {time.perf_counter() - start_time:.2f}s")
+        return run.id, run.status
+    except Exception as e:
+        # Fall back to polling; the run keeps going server-side if the stream broke after it was created, even
+        # when the stream broke before announcing it, and a second run would be refused while it is active
+        logger.error(f"Streaming failed, falling back to polling: {e}")
+        if run_id is None:
+            run_id = find_active_run(thread_id) or run_assistant(thread_id, assistant_id)
+        return run_id, poll_run_status(thread_id, run_id)
+
 def main():
-    
+    from openai import NotFoundError
+    resource_cache.get("process_configured", configure_process)
+
     openai_api_key = os.getenv("OPENAI_API_KEY")
 
     # Page Configuration
@@ -179,51 +325,31 @@ def main():
                         st.session_state.thread_id = thread_id
                     else:
                         add_message_to_thread(thread_id, query)
-                    # Run the assistant
-                    run_id = run_assistant(thread_id, assistant_id)
+                    # Run the assistant, streaming the answer as it is generated
+                    answer_placeholder = st.empty()
+                    run_id, status = stream_assistant(thread_id, assistant_id, answer_placeholder)
                     st.session_state.run_id = run_id
-
-                    # Check the status of the run
-                    status = check_run_status(thread_id, run_id)
                     st.session_state.status = status
+                    answer_placeholder.empty()
 
-                    while st.session_state.status != "completed":
-                        with st.spinner('Generating answer...'):
-                            backoff_time = 1  # Start with 1 second delay
-                            max_backoff_time = 30  # Maximum delay time
-                            max_retries = 10  # Maximum number of retries before timing out
-    
-                            retries = 0
-
-                            while st.session_state.status != "completed" and retries < max_retries:
-                                with st.spinner('Generating answer...'):
-                                    time.sleep(backoff_time)
-                                    st.session_state.status = check_run_status(thread_id, run_id)
-
-                                    # If status is still not completed, increase the delay with backoff
-                                    if st.session_state.status != "completed":
-                                        backoff_time = min(backoff_time * 2, max_backoff_time)  # Exponential backoff
-                                        retries += 1
-
-                            if st.session_state.status != "completed":
-                                st.error("Request timed out. Please try again.")
-                            st.session_state.status = check_run_status(thread_id, run_id)
-
-                    # Store conversation
-                    if 'chat_history' not in st.session_state:
-                        st.session_state.chat_history = []
-                    chat_history = retrieve_thread(st.session_state.thread_id)
-                    for message in chat_history:
-                        if message["role"] == "user":
-                            st.session_state.chat_history.append(f"USER: {message['content']}")
-                        else:
-                            st.session_state.chat_history.append(f"AI: {message['content']}")
+                    if st.session_state.status not in TERMINAL_RUN_STATUSES:
+                        st.error("Request timed out. Please try again.")
+                    elif st.session_state.status != "completed":
+                        st.error(f"The assistant could not complete the request ({st.session_state.status}). Please try again.")
+
+                    # Store only the messages added since the last turn
+                    update_chat_history(st.session_state.thread_id)
 
                     # Display conversation in reverse order
-                    for i, message in enumerate(reversed(st.session_state.chat_history)):
-                        if i % 2 == 0: st.markdown(bot_template.replace("{{MSG}}", message), unsafe_allow_html=True)
-                        else: st.markdown(user_template.replace("{{MSG}}", message), unsafe_allow_html=True)
-                        
+                    for message in reversed(st.session_state.chat_history):
+                        if message["role"] == "user": st.markdown(user_template.replace("{{MSG}}", f"USER: {message['content']}"), unsafe_allow_html=True)
+                        else: st.markdown(bot_template.replace("{{MSG}}", f"AI: {message['content']}"), unsafe_allow_html=True)
+
+                except NotFoundError as e:
+                    # The backend may have recreated the assistant; reload the ids on the next rerun
+                    resource_cache.invalidate("ids")
+                    st.error(f"An error occurred: {e}")
+                    logger.error(f"An error occurred: {e}")
                 except Exception as e:
                     st.error(f"An error occurred: {e}")
                     logger.error(f"An error occurred: {e}")
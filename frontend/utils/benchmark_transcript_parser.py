@@ -0,0 +1,269 @@
+import argparse
+import random
+import re
+import statistics
+import time
+
+from transcript_extractor import TranscriptParser
+
+# Micro-benchmark comparing the single-pass TranscriptParser with the previous whole-text regex parser
+# on synthetic multi-page transcripts. Run from the frontend directory:
+#   python utils/benchmark_transcript_parser.py --pages 1 5 20 --fixture long
+
+SUBJECTS = ['CS', 'MATH', 'PHYS', 'HUM', 'IS', 'IT', 'ECE', 'MGMT']
+TITLES = ['Roadmap to Computing', 'Data Structures', 'Calculus', 'Technical Writing', 'Database Systems', 'Operating Systems']
+GRADES = ['A', 'B+', 'B', 'C+', 'C', 'D', 'F']
+SEASONS = ['Spring', 'Summer', 'Fall']
+TERMS_PER_PAGE = 2
+
+# Function to build the lines of a transcript's transfer credit section, one block per institution
+def transfer_credit_lines(rng, institutions, courses_per_institution):
+    lines = ['TRANSFER CREDIT ACCEPTED BY INSTITUTION']
+    total_hours = 0
+    for index in range(institutions):
+        lines.append(f'{SEASONS[index % len(SEASONS)]} {2015 + index} : County College {index + 1}')
+        for _ in range(courses_per_institution):
+            lines.append(f'{rng.choice(SUBJECTS)} {rng.randint(100, 299)} {rng.choice(TITLES)} T 3.00 0.00')
+            total_hours += 3
+    lines += [
+        '',
+        'Attempt Hours Passed Hours Earned Hours GPA Hours Quality Points GPA',
+        f'Current Term {total_hours:.2f} {total_hours:.2f} {total_hours:.2f} 0.00 0.00 0.00'
+    ]
+    return lines
+
+# Function to build the text of a synthetic transcript, one string per page. The long fixture adds a degree
+# awarded section, a transfer section of several institutions, terms split across page breaks and several
+# courses in progress, the sections the previous parser matched with DOTALL patterns.
+def generate_transcript_pages(page_count, seed=0, long_sections=False):
+    rng = random.Random(seed)
+    pages = []
+    carried_courses = [] # Courses of a term split across the page break
+    for page_number in range(1, page_count + 1):
+        lines = ['NEW JERSEY INSTITUTE OF TECHNOLOGY', f'Unofficial Transcript Page {page_number} of {page_count}']
+        if carried_courses:
+            lines += carried_courses + [
+                'Term Totals (Undergraduate) Attempt Hours Passed Hours Earned Hours GPA Hours Quality Points GPA',
+                'Current Term 15.00 15.00 15.00 15.00 45.00 3.000'
+            ]
+            carried_courses = []
+        if page_number == 1:
+            lines += [
+                'Name Jane Doe',
+                'Birth Date 01/01/2000',
+                'Current Program Bachelor of Science',
+                'Current College Computing Sciences',
+                'Current Major and Department Computer Science, Computer Science'
+            ]
+            if long_sections:
+                lines += [
+                    'DEGREE AWARDED',
+                    'Associate in Science 05/15/2017',
+                    'Program Associate in Science',
+                    'College Computing Sciences',
+                    'Awarded with Honors',
+                    'Minor None',
+                    'Major Computer Science'
+                ]
+                lines += transfer_credit_lines(rng, 3, 12)
+            else:
+                lines += transfer_credit_lines(rng, 1, 2)
+        for term_index in range(TERMS_PER_PAGE):
+            year = 2018 + (page_number * TERMS_PER_PAGE + term_index) // len(SEASONS)
+            lines += [
+                f'Term : {SEASONS[term_index % len(SEASONS)]} {year}',
+                'Subject Course Level Title Grade Credit Hours Quality Points R'
+            ]
+            courses = [f'{rng.choice(SUBJECTS)} {rng.randint(100, 499)} U {rng.choice(TITLES)} {rng.choice(GRADES)} 3.00 {rng.uniform(0, 12):.2f}'
+                       for _ in range(rng.randint(4, 6))]
+            if long_sections and term_index == TERMS_PER_PAGE - 1 and page_number < page_count:
+                # The last term of the page continues after the header of the next page
+                lines += courses[:2]
+                carried_courses = courses[2:]
+                continue
+            lines += courses + [
+                'Term Totals (Undergraduate) Attempt Hours Passed Hours Earned Hours GPA Hours Quality Points GPA',
+                'Current Term 15.00 15.00 15.00 15.00 45.00 3.000'
+            ]
+        if page_number == page_count:
+            lines += [
+                'Transcript Totals - (Undergraduate)',
+                'Attempt Hours Passed Hours Earned Hours GPA Hours Quality Points GPA',
+                'Total Institution 90.00 90.00 90.00 90.00 270.00 3.000',
+                'Total Transfer 7.00 7.00 7.00 0.00 0.00 0.000',
+                'Overall 97.00 97.00 97.00 90.00 270.00 3.000',
+                'COURSE(S) IN PROGRESS',
+                'Term : Spring 2025',
+                'College Computing Sciences',
+                'Major Computer Science',
+                'Subject Course Level Title Credit Hours'
+            ]
+            in_progress_count = 6 if long_sections else 1
+            lines += [f'{rng.choice(SUBJECTS)} {rng.randint(300, 499)} U {rng.choice(TITLES)} 3.00' for _ in range(in_progress_count)]
+            lines.append('***END OF TRANSCRIPT***')
+        pages.append('\n'.join(lines))
+    return pages
+
+# Previous implementation, kept here as the baseline: page text concatenation and whole-text regex scans
+def legacy_parse_transcript(pages):
+    text = ''
+    for page in pages:
+        text += page + '\n'
+
+    
+    transcript_data = {}
+
+    # Extracting student information
+    student_info_pattern = re.compile(r'Name\s*(.*)\n\s*Birth Date\s*(.*)\n.*Program\s*(.*)\n.*College\s*(.*)\n.*Major and Department\s*(.*)\n')
+    match = student_info_pattern.search(text)
+    if match:
+        transcript_data['student_info'] = {
+            'name': match.group(1).strip(),
+            'birth_date': match.group(2).strip(),
+            'program': match.group(3).strip(),
+            'college': match.group(4).strip(),
+            'major_and_department': match.group(5).strip()
+        }
+
+    # Extracting degree information
+    degree_info_pattern = re.compile(r'DEGREE AWARDED\s*\n.*\nProgram\s*(.*?)\n.*\n.*\n.*\nMajor\s*(.*?)\n')
+    match = degree_info_pattern.search(text)
+    if match:
+        transcript_data['degree_info'] = {
+            'program': match.group(1).strip(),
+            'major': match.group(2).strip()
+        }
+
+    # Extracting transfer credit information
+    transfer_credit_pattern = re.compile(r'TRANSFER CREDIT ACCEPTED BY INSTITUTION\n(.*?)\n\nAttempt Hours Passed Hours Earned Hours GPA Hours Quality Points GPA', re.DOTALL)
+    match = transfer_credit_pattern.search(text)
+    if match:
+        transfer_credits = []
+        transfer_entries = re.findall(r'([A-Z]+\s\d+)\s+(.*?)\s+([A-Z])\s+([\d.]+)\s+([\d.]+)', match.group(1))
+        for entry in transfer_entries:
+            credit = {
+                'course_code': entry[0].strip(),
+                'course_title': entry[1].strip(),
+                'grade': entry[2].strip(),
+                'credit_hours': float(entry[3].strip()),
+                'quality_points': float(entry[4].strip())
+            }
+            transfer_credits.append(credit)
+        transcript_data['transfer_credits'] = transfer_credits
+
+    # Extracting course information
+    courses_pattern = re.compile(r'Term\s*:\s*(.*?)\n.*?\n(.*?)\nTerm Totals.*?\n.*?\n', re.DOTALL)
+    transcript_data['courses'] = []
+    for term, course_text in courses_pattern.findall(text):
+        course_entries = re.findall(r'([A-Z]+ \d+)\s+U\s+(.*?)\s+([A-F][+-]?)\s+([\d.]+)\s+([\d.]+)', course_text)
+        for entry in course_entries:
+            course = {
+                'term': term.strip(),
+                'course_code': entry[0].strip(),
+                'course_title': entry[1].strip(),
+                'grade': entry[2].strip(),
+                'credit_hours': float(entry[3].strip()),
+                'quality_points': float(entry[4].strip())
+            }
+            transcript_data['courses'].append(course)
+
+    # Extracting cumulative GPA information
+    gpa_pattern = re.compile(r'Transcript Totals\s*-\s*\(Undergraduate\)\s*Attempt Hours Passed Hours Earned Hours GPA Hours Quality Points GPA\s*Total Institution\s*(.*?)\s*Total Transfer\s*(.*?)\s*Overall\s*(.*?)\s*\n', re.DOTALL)
+    match = gpa_pattern.search(text)
+    if match:
+        total_institution = match.group(1).split()
+        total_transfer = match.group(2).split()
+        overall = match.group(3).split()
+        
+        transcript_data['gpa_totals'] = {
+            'total_institution': {
+                'attempt_hours': float(total_institution[0]),
+                'passed_hours': float(total_institution[1]),
+                'earned_hours': float(total_institution[2]),
+                'gpa_hours': float(total_institution[3]),
+                'quality_points': float(total_institution[4]),
+                'gpa': float(total_institution[5])
+            },
+            'total_transfer': {
+                'attempt_hours': float(total_transfer[0]),
+                'passed_hours': float(total_transfer[1]),
+                'earned_hours': float(total_transfer[2]),
+                'gpa_hours': float(total_transfer[3]),
+                'quality_points': float(total_transfer[4]),
+                'gpa': float(total_transfer[5])
+            },
+            'overall': {
+                'attempt_hours': float(overall[0]),
+                'passed_hours': float(overall[1]),
+                'earned_hours': float(overall[2]),
+                'gpa_hours': float(overall[3]),
+                'quality_points': float(overall[4]),
+                'gpa': float(overall[5])
+            }
+        }
+
+    # Extracting courses in progress
+    in_progress_pattern = re.compile(r'COURSE\(S\) IN PROGRESS\s*Term\s*:\s*(.*?)\s*College\s*(.*?)\s*Major\s*(.*?)\s*Subject Course Level Title Credit Hours\s*(.*?)\s*\n', re.DOTALL)
+    match = in_progress_pattern.search(text)
+    if match:
+        courses_in_progress = []
+        course_entries = re.findall(r'([A-Z]+ \d+)\s+U\s+(.*?)\s+([\d.]+)', match.group(4))
+        for entry in course_entries:
+            course = {
+                'term': match.group(1).strip(),
+                'course_code': entry[0].strip(),
+                'course_title': entry[1].strip(),
+                'credit_hours': float(entry[2].strip())
+            }
+            courses_in_progress.append(course)
+        transcript_data['courses_in_progress'] = courses_in_progress
+
+    return transcript_data
+
+def parse_transcript(pages):
+    parser = TranscriptParser()
+    for page in pages:
+        parser.feed(page)
+    return parser.close()
+
+def time_parser(parse, pages, repeat):
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        parse(pages)
+        timings.append(time.perf_counter() - start_time)
+    return statistics.median(timings)
+
+# Function to get the parsed sections other than the courses in progress, which the previous parser truncated
+def without_courses_in_progress(transcript_data):
+    return {key: value for key, value in transcript_data.items() if key != 'courses_in_progress'}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transcript parsing time per page.")
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 5, 20, 50], help="Transcript lengths in pages")
+    parser.add_argument('--repeat', type=int, default=50, help="Runs per measurement; the median is reported")
+    parser.add_argument('--fixture', choices=['basic', 'long', 'all'], default='all',
+                        help="basic: short sections; long: long transfer, degree, split term and in-progress sections")
+    args = parser.parse_args()
+
+    fixtures = ['basic', 'long'] if args.fixture == 'all' else [args.fixture]
+    # "same output" compares every section except the courses in progress, which the previous parser cut to the
+    # first course; "in progress" lists the number of courses in progress found by each parser
+    print(f"{'fixture':>8} {'pages':>6} {'legacy ms/page':>15} {'single-pass ms/page':>20} {'speedup':>8} "
+          f"{'same output':>12} {'in progress (legacy/single-pass)':>33}")
+    for fixture in fixtures:
+        for page_count in args.pages:
+            pages = generate_transcript_pages(page_count, long_sections=fixture == 'long')
+            legacy_time = time_parser(legacy_parse_transcript, pages, args.repeat)
+            single_pass_time = time_parser(parse_transcript, pages, args.repeat)
+            legacy_output = legacy_parse_transcript(pages)
+            single_pass_output = parse_transcript(pages)
+            same_output = without_courses_in_progress(legacy_output) == without_courses_in_progress(single_pass_output)
+            in_progress = (f"{len(legacy_output.get('courses_in_progress', []))}/"
+                           f"{len(single_pass_output.get('courses_in_progress', []))}")
+            print(f"{fixture:>8} {page_count:>6} {legacy_time * 1000 / page_count:>15.3f} "
+                  f"{single_pass_time * 1000 / page_count:>20.3f} {legacy_time / single_pass_time:>7.1f}x "
+                  f"{str(same_output):>12} {in_progress:>33}")
+
+if __name__ == "__main__":
+    main()
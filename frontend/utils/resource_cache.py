@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class ResourceCache:
+    """
+    Process-wide cache for clients and lookups that should survive Streamlit reruns and sessions.
+
+    Entries younger than `ttl` are returned as is. Entries older than `ttl` but within `stale_ttl`
+    are returned immediately while a background thread reloads them (stale-while-revalidate).
+    Older entries, or missing ones, are loaded synchronously.
+    """
+
+    def __init__(self):
+        self._entries = {} # key -> (value, loaded_at)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._refreshing = set()
+
+    def _get_key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _get_fresh_entry(self, key, max_age):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if max_age is not None and time.monotonic() - entry[1] >= max_age:
+            return None
+        return entry
+
+    def _load(self, key, loader):
+        value = loader()
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+        logger.info(f"Loaded resource: {key}")
+        return value
+
+    def _refresh(self, key, loader):
+        try:
+            with self._get_key_lock(key):
+                self._load(key, loader)
+        except Exception as e:
+            # Keep serving the stale value; the next expired read will try again
+            logger.error(f"Failed to refresh resource {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _refresh_in_background(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+
+    def get(self, key, loader, ttl=None, stale_ttl=0):
+        """
+        Return the cached value for `key`, calling `loader` to build it when needed.
+        A `ttl` of None caches the value until it is invalidated.
+        """
+        entry = self._get_fresh_entry(key, ttl)
+        if entry is not None:
+            return entry[0]
+
+        stale_entry = self._get_fresh_entry(key, None if ttl is None else ttl + stale_ttl)
+        if stale_entry is not None:
+            self._refresh_in_background(key, loader)
+            return stale_entry[0]
+
+        with self._get_key_lock(key):
+            # Another session may have loaded the value while we waited for the lock
+            entry = self._get_fresh_entry(key, ttl)
+            if entry is not None:
+                return entry[0]
+            return self._load(key, loader)
+
+    def invalidate(self, key=None):
+        """
+        Drop a single entry, or every entry when no key is given.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+        logger.info(f"Invalidated resource: {key if key is not None else 'all'}")
+
+# Shared instance; imported modules are not re-executed on Streamlit reruns
+resource_cache = ResourceCache()
@@ -1,132 +1,420 @@
 
-import pdfplumber
+import argparse
+import glob
 import json
+import logging
+import os
 import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
 
-def extract_full_transcript_info(pdf_path):
-    with pdfplumber.open(pdf_path) as pdf:
-        text = ''
-        for page in pdf.pages:
-            text += page.extract_text() + '\n'
-    
-    transcript_data = {}
-
-    # Extracting student information
-    student_info_pattern = re.compile(r'Name\s*(.*)\n\s*Birth Date\s*(.*)\n.*Program\s*(.*)\n.*College\s*(.*)\n.*Major and Department\s*(.*)\n')
-    match = student_info_pattern.search(text)
-    if match:
-        transcript_data['student_info'] = {
-            'name': match.group(1).strip(),
-            'birth_date': match.group(2).strip(),
-            'program': match.group(3).strip(),
-            'college': match.group(4).strip(),
-            'major_and_department': match.group(5).strip()
-        }
+logger = logging.getLogger(__name__)
+
+# Patterns for the single-pass transcript parser, compiled once per process
+NAME_PATTERN = re.compile(r'Name\s*(.*)')
+BIRTH_DATE_PATTERN = re.compile(r'\s*Birth Date\s*(.*)')
+STUDENT_INFO_PATTERNS = [
+    ('program', re.compile(r'.*Program\s*(.*)')),
+    ('college', re.compile(r'.*College\s*(.*)')),
+    ('major_and_department', re.compile(r'.*Major and Department\s*(.*)'))
+]
+DEGREE_AWARDED_PATTERN = re.compile(r'DEGREE AWARDED')
+DEGREE_PROGRAM_PATTERN = re.compile(r'Program\s*(.*)')
+DEGREE_MAJOR_PATTERN = re.compile(r'Major\s*(.*)')
+TRANSFER_CREDIT_PATTERN = re.compile(r'TRANSFER CREDIT ACCEPTED BY INSTITUTION')
+TOTALS_HEADER_PATTERN = re.compile(r'\s*Attempt Hours Passed Hours Earned Hours GPA Hours Quality Points GPA')
+TRANSFER_ENTRY_PATTERN = re.compile(r'([A-Z]+\s\d+)\s+(.*?)\s+([A-Z])\s+([\d.]+)\s+([\d.]+)')
+TERM_PATTERN = re.compile(r'Term\s*:\s*(.*)')
+TERM_TOTALS_PATTERN = re.compile(r'Term Totals')
+COURSE_PATTERN = re.compile(r'([A-Z]+ \d+)\s+U\s+(.*?)\s+([A-F][+-]?)\s+([\d.]+)\s+([\d.]+)')
+GPA_TOTALS_PATTERN = re.compile(r'Transcript Totals\s*-\s*\(Undergraduate\)\s*(.*)')
+GPA_TOTALS_ROW_PATTERNS = [
+    ('total_institution', re.compile(r'\s*Total Institution\s*(.*)')),
+    ('total_transfer', re.compile(r'\s*Total Transfer\s*(.*)')),
+    ('overall', re.compile(r'\s*Overall\s*(.*)'))
+]
+GPA_TOTALS_FIELDS = ['attempt_hours', 'passed_hours', 'earned_hours', 'gpa_hours', 'quality_points', 'gpa']
+IN_PROGRESS_PATTERN = re.compile(r'COURSE\(S\) IN PROGRESS\s*(.*)')
+IN_PROGRESS_TERM_PATTERN = re.compile(r'Term\s*:\s*(.*?)\s*(?:College.*)?$')
+IN_PROGRESS_HEADER_PATTERN = re.compile(r'.*Subject Course Level Title Credit Hours')
+IN_PROGRESS_COURSE_PATTERN = re.compile(r'([A-Z]+ \d+)\s+U\s+(.*?)\s+([\d.]+)')
+SECTION_START_PATTERN = re.compile(r'DEGREE AWARDED|TRANSFER CREDIT ACCEPTED BY INSTITUTION|Term\s*:|Transcript Totals\s*-\s*\(Undergraduate\)|COURSE\(S\) IN PROGRESS')
+
+# Sections after which nothing else is extracted; courses in progress come last on the transcript
+REQUIRED_SECTIONS = ('student_info', 'gpa_totals', 'courses_in_progress')
+
+class TranscriptParser:
+    """
+    Line-oriented state machine that extracts every transcript section in a single pass.
 
-    # Extracting degree information
-    degree_info_pattern = re.compile(r'DEGREE AWARDED\s*\n.*\nProgram\s*(.*?)\n.*\n.*\n.*\nMajor\s*(.*?)\n')
-    match = degree_info_pattern.search(text)
-    if match:
-        transcript_data['degree_info'] = {
-            'program': match.group(1).strip(),
-            'major': match.group(2).strip()
+    Text is fed with `feed` (a page or any chunk of whole lines) and `close` returns the same
+    dict as `extract_full_transcript_info`. Each section state consumes the lines it expects
+    and hands any other line back to the scanner.
+    """
+
+    def __init__(self):
+        self._sections = {}
+        self._courses = []
+        self._state = None
+        self._step = 0
+        self._section = None # Partial data of the section being parsed
+        self._transfer_credits = None
+        self._previous_line = ''
+        self._parsers = {
+            'student_info': self._parse_student_info,
+            'degree': self._parse_degree,
+            'term': self._parse_term,
+            'gpa_totals': self._parse_gpa_totals,
+            'in_progress': self._parse_in_progress
         }
 
-    # Extracting transfer credit information
-    transfer_credit_pattern = re.compile(r'TRANSFER CREDIT ACCEPTED BY INSTITUTION\n(.*?)\n\nAttempt Hours Passed Hours Earned Hours GPA Hours Quality Points GPA', re.DOTALL)
-    match = transfer_credit_pattern.search(text)
-    if match:
-        transfer_credits = []
-        transfer_entries = re.findall(r'([A-Z]+\s\d+)\s+(.*?)\s+([A-Z])\s+([\d.]+)\s+([\d.]+)', match.group(1))
-        for entry in transfer_entries:
-            credit = {
-                'course_code': entry[0].strip(),
-                'course_title': entry[1].strip(),
-                'grade': entry[2].strip(),
-                'credit_hours': float(entry[3].strip()),
-                'quality_points': float(entry[4].strip())
-            }
-            transfer_credits.append(credit)
-        transcript_data['transfer_credits'] = transfer_credits
-
-    # Extracting course information
-    courses_pattern = re.compile(r'Term\s*:\s*(.*?)\n.*?\n(.*?)\nTerm Totals.*?\n.*?\n', re.DOTALL)
-    transcript_data['courses'] = []
-    for term, course_text in courses_pattern.findall(text):
-        course_entries = re.findall(r'([A-Z]+ \d+)\s+U\s+(.*?)\s+([A-F][+-]?)\s+([\d.]+)\s+([\d.]+)', course_text)
-        for entry in course_entries:
-            course = {
-                'term': term.strip(),
+    def feed(self, text):
+        for line in text.split('\n'):
+            self.feed_line(line)
+
+    def feed_line(self, line):
+        # Transfer credits are collected alongside the other states until their totals header
+        if self._transfer_credits is not None:
+            self._collect_transfer_credit(line)
+        if self._state is None or not self._parsers[self._state](line):
+            self._state = None
+            self._scan(line)
+        self._previous_line = line
+
+    def is_complete(self, required_sections=REQUIRED_SECTIONS):
+        return all(section in self._sections for section in required_sections)
+
+    def close(self):
+        # Courses in progress run to the end of the transcript; other unfinished sections are dropped
+        if self._state == 'in_progress' and self._step == 2:
+            self._sections['courses_in_progress'] = self._section['courses']
+        self._state = None
+
+        transcript_data = {}
+        for key in ('student_info', 'degree_info', 'transfer_credits'):
+            if key in self._sections:
+                transcript_data[key] = self._sections[key]
+        transcript_data['courses'] = self._courses
+        for key in ('gpa_totals', 'courses_in_progress'):
+            if key in self._sections:
+                transcript_data[key] = self._sections[key]
+        return transcript_data
+
+    def _start(self, state, section):
+        self._state = state
+        self._step = 0
+        self._section = section
+
+    def _scan(self, line):
+        if not SECTION_START_PATTERN.search(line):
+            if 'student_info' not in self._sections:
+                self._scan_student_info(line)
+            return
+        match = IN_PROGRESS_PATTERN.search(line)
+        if match:
+            if 'courses_in_progress' not in self._sections:
+                self._start('in_progress', {'term': None, 'courses': []})
+                if match.group(1):
+                    self._parse_in_progress(match.group(1))
+            return
+        if DEGREE_AWARDED_PATTERN.search(line):
+            if 'degree_info' not in self._sections:
+                self._start('degree', {})
+            return
+        if TRANSFER_CREDIT_PATTERN.search(line):
+            if 'transfer_credits' not in self._sections:
+                self._transfer_credits = []
+            return
+        match = GPA_TOTALS_PATTERN.search(line)
+        if match:
+            if 'gpa_totals' not in self._sections:
+                self._start('gpa_totals', {})
+                if match.group(1):
+                    self._parse_gpa_totals(match.group(1))
+            return
+        match = TERM_PATTERN.search(line)
+        if match:
+            self._start('term', {'term': match.group(1).strip(), 'courses': []})
+
+    def _scan_student_info(self, line):
+        birth_date_match = BIRTH_DATE_PATTERN.match(line)
+        if birth_date_match:
+            name_match = NAME_PATTERN.search(self._previous_line)
+            if name_match:
+                self._start('student_info', {
+                    'name': name_match.group(1).strip(),
+                    'birth_date': birth_date_match.group(1).strip()
+                })
+
+    def _parse_student_info(self, line):
+        key, pattern = STUDENT_INFO_PATTERNS[self._step]
+        match = pattern.match(line)
+        if not match:
+            return False
+        self._section[key] = match.group(1).strip()
+        self._step += 1
+        if self._step == len(STUDENT_INFO_PATTERNS):
+            self._sections['student_info'] = self._section
+            self._state = None
+        return True
+
+    def _parse_degree(self, line):
+        # DEGREE AWARDED, one line, Program, three lines, Major
+        if self._step == 1 or self._step == 5:
+            match = (DEGREE_PROGRAM_PATTERN if self._step == 1 else DEGREE_MAJOR_PATTERN).match(line)
+            if not match:
+                return False
+            self._section['program' if self._step == 1 else 'major'] = match.group(1).strip()
+            if self._step == 5:
+                self._sections['degree_info'] = self._section
+                self._state = None
+        self._step += 1
+        return True
+
+    def _collect_transfer_credit(self, line):
+        if TOTALS_HEADER_PATTERN.match(line):
+            self._sections['transfer_credits'] = self._transfer_credits
+            self._transfer_credits = None
+            return
+        for entry in TRANSFER_ENTRY_PATTERN.findall(line):
+            self._transfer_credits.append({
                 'course_code': entry[0].strip(),
                 'course_title': entry[1].strip(),
                 'grade': entry[2].strip(),
                 'credit_hours': float(entry[3].strip()),
                 'quality_points': float(entry[4].strip())
-            }
-            transcript_data['courses'].append(course)
-
-    # Extracting cumulative GPA information
-    gpa_pattern = re.compile(r'Transcript Totals\s*-\s*\(Undergraduate\)\s*Attempt Hours Passed Hours Earned Hours GPA Hours Quality Points GPA\s*Total Institution\s*(.*?)\s*Total Transfer\s*(.*?)\s*Overall\s*(.*?)\s*\n', re.DOTALL)
-    match = gpa_pattern.search(text)
-    if match:
-        total_institution = match.group(1).split()
-        total_transfer = match.group(2).split()
-        overall = match.group(3).split()
-        
-        transcript_data['gpa_totals'] = {
-            'total_institution': {
-                'attempt_hours': float(total_institution[0]),
-                'passed_hours': float(total_institution[1]),
-                'earned_hours': float(total_institution[2]),
-                'gpa_hours': float(total_institution[3]),
-                'quality_points': float(total_institution[4]),
-                'gpa': float(total_institution[5])
-            },
-            'total_transfer': {
-                'attempt_hours': float(total_transfer[0]),
-                'passed_hours': float(total_transfer[1]),
-                'earned_hours': float(total_transfer[2]),
-                'gpa_hours': float(total_transfer[3]),
-                'quality_points': float(total_transfer[4]),
-                'gpa': float(total_transfer[5])
-            },
-            'overall': {
-                'attempt_hours': float(overall[0]),
-                'passed_hours': float(overall[1]),
-                'earned_hours': float(overall[2]),
-                'gpa_hours': float(overall[3]),
-                'quality_points': float(overall[4]),
-                'gpa': float(overall[5])
-            }
+            })
+
+    def _parse_term(self, line):
+        # Term : <term>, a column header line, the courses, Term Totals and one more totals line
+        if self._step == 0:
+            self._step = 1
+            return True
+        if self._step == 2:
+            self._state = None
+            return True
+        entries = COURSE_PATTERN.findall(line)
+        if entries:
+            term = self._section['term']
+            # The pattern's groups carry no surrounding whitespace, so they are used as is
+            for code, title, grade, credit_hours, quality_points in entries:
+                self._section['courses'].append({
+                    'term': term,
+                    'course_code': code,
+                    'course_title': title,
+                    'grade': grade,
+                    'credit_hours': float(credit_hours),
+                    'quality_points': float(quality_points)
+                })
+            return True
+        if TERM_TOTALS_PATTERN.match(line):
+            self._courses.extend(self._section['courses'])
+            self._step = 2
+            return True
+        if SECTION_START_PATTERN.search(line):
+            self._courses.extend(self._section['courses'])
+            return False
+        return True
+
+    def _parse_gpa_totals(self, line):
+        if self._step == 0:
+            # The column header line may be split from the Transcript Totals line
+            if TOTALS_HEADER_PATTERN.match(line):
+                self._step = 1
+                return True
+            return not line.strip()
+        key, pattern = GPA_TOTALS_ROW_PATTERNS[self._step - 1]
+        match = pattern.match(line)
+        if not match:
+            return False
+        values = match.group(1).split()
+        self._section[key] = {field: float(values[i]) for i, field in enumerate(GPA_TOTALS_FIELDS)}
+        self._step += 1
+        if self._step > len(GPA_TOTALS_ROW_PATTERNS):
+            self._sections['gpa_totals'] = self._section
+            self._state = None
+        return True
+
+    def _parse_in_progress(self, line):
+        # COURSE(S) IN PROGRESS, Term : <term> [College ...], College/Major lines, column header, courses
+        if self._step == 0:
+            match = IN_PROGRESS_TERM_PATTERN.search(line)
+            if match:
+                self._section['term'] = match.group(1).strip()
+                self._step = 1
+            elif line.strip():
+                return False
+            return True
+        if self._step == 1:
+            if IN_PROGRESS_HEADER_PATTERN.match(line):
+                self._step = 2
+                return True
+            return not SECTION_START_PATTERN.search(line)
+        entries = IN_PROGRESS_COURSE_PATTERN.findall(line)
+        if not entries:
+            if not line.strip():
+                return True
+            self._sections['courses_in_progress'] = self._section['courses']
+            return False
+        for code, title, credit_hours in entries:
+            self._section['courses'].append({
+                'term': self._section['term'],
+                'course_code': code,
+                'course_title': title,
+                'credit_hours': float(credit_hours)
+            })
+        return True
+
+# Function to lazily yield the text of each page, releasing the page's parsed objects once its text is extracted
+def iter_page_text(pdf):
+    for page in pdf.pages:
+        try:
+            text = page.extract_text() or '' # Image-only pages have no text layer
+        finally:
+            if hasattr(page, 'close'):
+                page.close()
+            else:
+                page.flush_cache()
+        yield text
+
+def extract_full_transcript_info(pdf_path, stop_early=True):
+    import pdfplumber
+    parser = TranscriptParser()
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_number, text in enumerate(iter_page_text(pdf), start=1):
+            parser.feed(text)
+            # The remaining pages hold nothing the parser still needs
+            if stop_early and parser.is_complete():
+                if page_number < len(pdf.pages):
+                    logger.info(f"Stopped after page {page_number} of {len(pdf.pages)}")
+                break
+    return parser.close()
+
+# Function to reduce extracted transcript data to the compact profile sent to the assistant
+def build_transcript_profile(transcript_data):
+    profile = {}
+    student_info = transcript_data.get('student_info')
+    if student_info:
+        profile['student'] = {
+            'program': student_info['program'],
+            'college': student_info['college'],
+            'major_and_department': student_info['major_and_department']
         }
+    if 'degree_info' in transcript_data:
+        profile['degree_awarded'] = transcript_data['degree_info']
 
-    # Extracting courses in progress
-    in_progress_pattern = re.compile(r'COURSE\(S\) IN PROGRESS\s*Term\s*:\s*(.*?)\s*College\s*(.*?)\s*Major\s*(.*?)\s*Subject Course Level Title Credit Hours\s*(.*?)\s*\n', re.DOTALL)
-    match = in_progress_pattern.search(text)
-    if match:
-        courses_in_progress = []
-        course_entries = re.findall(r'([A-Z]+ \d+)\s+U\s+(.*?)\s+([\d.]+)', match.group(4))
-        for entry in course_entries:
-            course = {
-                'term': match.group(1).strip(),
-                'course_code': entry[0].strip(),
-                'course_title': entry[1].strip(),
-                'credit_hours': float(entry[2].strip())
-            }
-            courses_in_progress.append(course)
-        transcript_data['courses_in_progress'] = courses_in_progress
+    completed_courses = []
+    for credit in transcript_data.get('transfer_credits', []):
+        completed_courses.append({
+            'code': credit['course_code'],
+            'title': credit['course_title'],
+            'grade': credit['grade'],
+            'credits': credit['credit_hours'],
+            'term': 'Transfer'
+        })
+    for course in transcript_data.get('courses', []):
+        completed_courses.append({
+            'code': course['course_code'],
+            'title': course['course_title'],
+            'grade': course['grade'],
+            'credits': course['credit_hours'],
+            'term': course['term']
+        })
+    profile['completed_courses'] = completed_courses
+
+    profile['courses_in_progress'] = [{
+        'code': course['course_code'],
+        'title': course['course_title'],
+        'credits': course['credit_hours'],
+        'term': course['term']
+    } for course in transcript_data.get('courses_in_progress', [])]
+
+    gpa_totals = transcript_data.get('gpa_totals')
+    if gpa_totals:
+        profile['gpa_totals'] = gpa_totals
+    return profile
 
-    return transcript_data
+# Function to parse a transcript into a compact JSON profile, returning None if nothing usable was found
+def extract_transcript_profile(pdf_file):
+    transcript_data = extract_full_transcript_info(pdf_file)
+    if 'student_info' not in transcript_data or not (transcript_data.get('courses') or transcript_data.get('courses_in_progress')):
+        return None
+    return json.dumps(build_transcript_profile(transcript_data), separators=(',', ':'))
 
 def save_as_json(data, output_path):
     with open(output_path, 'w') as json_file:
         json.dump(data, json_file, indent=4)
 
-# Paths to the PDF transcripts
-pdf_paths = []
-output_files = []
+# Function to extract a single transcript into a JSON Lines record with timing and error information
+def extract_transcript_record(pdf_path):
+    start_time = time.perf_counter()
+    try:
+        transcript_data = extract_full_transcript_info(pdf_path)
+        return {
+            'file': pdf_path,
+            'status': 'ok',
+            'seconds': round(time.perf_counter() - start_time, 4),
+            'data': transcript_data
+        }
+    except Exception as e:
+        return {
+            'file': pdf_path,
+            'status': 'error',
+            'seconds': round(time.perf_counter() - start_time, 4),
+            'error': f"{type(e).__name__}: {e}"
+        }
+
+# Function to lazily list the PDFs in a directory or matching a glob pattern
+def iter_transcript_paths(source):
+    if os.path.isdir(source):
+        with os.scandir(source) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith('.pdf'):
+                    yield entry.path
+    else:
+        yield from glob.iglob(source, recursive=True)
+
+# Function to extract transcripts across a process pool, yielding records as they complete. The process pool
+# and multiprocessing are imported here, so the app importing this module for single transcripts skips them.
+def extract_transcripts_batch(pdf_paths, max_workers=None):
+    from concurrent.futures import ProcessPoolExecutor
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_workers * 2 # Bound the number of submitted files so memory stays flat for large batches
+    pdf_paths = iter(pdf_paths)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for pdf_path in pdf_paths:
+            pending.add(executor.submit(extract_transcript_record, pdf_path))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract transcript information from PDFs into JSON Lines.")
+    parser.add_argument('source', help="Directory of PDF transcripts or a glob pattern such as 'transcripts/**/*.pdf'")
+    parser.add_argument('-o', '--output', help="Output JSON Lines file (defaults to stdout)")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="Number of worker processes (defaults to the CPU count)")
+    args = parser.parse_args()
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    start_time = time.perf_counter()
+    processed = failed = 0
+    try:
+        for record in extract_transcripts_batch(iter_transcript_paths(args.source), args.workers):
+            output.write(json.dumps(record) + '\n')
+            output.flush()
+            processed += 1
+            if record['status'] != 'ok':
+                failed += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start_time
+    print(f"Processed {processed} transcripts ({failed} failed) in {elapsed:.2f}s", file=sys.stderr)
 
-for pdf_path, output_file in zip(pdf_paths, output_files):
-    transcript_data = extract_full_transcript_info(pdf_path)
-    save_as_json(transcript_data, output_file)
-    print(f"Saved {output_file}")
+if __name__ == "__main__":
+    main()
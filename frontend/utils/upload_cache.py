@@ -0,0 +1,89 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class FileUploadCache:
+    """
+    Content-addressed cache mapping the SHA-256 of uploaded bytes to the id of an already uploaded file.
+
+    At most `max_entries` are kept in least-recently-used order; entries dropped that way only lose
+    their mapping, since the file may still be attached to a live thread. Entries not used for `ttl`
+    seconds, counted from their upload or last reuse, are removed by `cleanup`, which passes their file
+    ids to `on_expire` so they can be deleted.
+    """
+
+    def __init__(self, max_entries=256, ttl=24 * 60 * 60, on_expire=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_expire = on_expire
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # content hash -> (file_id, last_used_at), least recently used first
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @staticmethod
+    def hash_content(content):
+        return hashlib.sha256(content).hexdigest()
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is None or now - entry[1] >= self.ttl:
+                return None
+            # A reused file is attached to another thread, so its expiry restarts from now
+            self._entries[key] = (entry[0], now)
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _store(self, key, file_id):
+        with self._lock:
+            self._entries[key] = (file_id, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted_key, (evicted_file_id, _) = self._entries.popitem(last=False)
+                logger.info(f"Evicted least recently used upload {evicted_file_id} ({evicted_key[:12]})")
+
+    def get_or_upload(self, content, upload):
+        """
+        Return the file id for `content`, calling `upload(content)` only if it has not been uploaded before.
+        """
+        self.cleanup()
+        key = self.hash_content(content)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            file_id = self._lookup(key)
+            if file_id is not None:
+                self.hits += 1
+                logger.info(f"Reusing uploaded file {file_id} for content {key[:12]}")
+                return file_id
+            self.misses += 1
+            file_id = upload(content)
+            self._store(key, file_id)
+            logger.info(f"Uploaded file {file_id} for content {key[:12]}")
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return file_id
+
+    def cleanup(self):
+        """
+        Remove expired entries and hand their file ids to the `on_expire` hook.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, last_used_at) in self._entries.items() if now - last_used_at >= self.ttl]
+            expired_file_ids = [self._entries.pop(key)[0] for key in expired]
+        for file_id in expired_file_ids:
+            logger.info(f"Upload {file_id} expired")
+            if self.on_expire:
+                try:
+                    self.on_expire(file_id)
+                except Exception as e:
+                    logger.error(f"Failed to clean up expired upload {file_id}: {e}")
+        return expired_file_ids